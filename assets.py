@@ -0,0 +1,77 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+# -------------------------
+# Static assets
+# -------------------------
+# Files under static/ are read once at startup, fingerprinted by content hash
+# and precompressed, so they can be served from memory with far-future cache
+# headers. A changed file gets a new hash and therefore a new URL.
+
+COMPRESSIBLE_TYPES = {"text/html", "text/css", "text/csv", "application/javascript", "text/javascript", "application/json"}
+MIN_COMPRESS_SIZE = 512
+
+
+def negotiate_encoding(accept_encodings):
+    """Pick the best supported Content-Encoding from a werkzeug Accept object."""
+    if brotli is not None and accept_encodings.quality("br") > 0:
+        return "br"
+    if accept_encodings.quality("gzip") > 0:
+        return "gzip"
+    return None
+
+
+def compress(data, encoding, best=False):
+    if encoding == "br":
+        return brotli.compress(data, quality=11 if best else 5)
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=9 if best else 6)
+    raise ValueError(f"unsupported encoding: {encoding}")
+
+
+class Asset:
+    __slots__ = ("path", "mimetype", "digest", "variants")
+
+    def __init__(self, path, data):
+        self.path = path
+        self.mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self.digest = hashlib.sha256(data).hexdigest()[:16]
+        self.variants = {None: data}
+        if self.mimetype in COMPRESSIBLE_TYPES and len(data) >= MIN_COMPRESS_SIZE:
+            encodings = ["gzip"] + (["br"] if brotli is not None else [])
+            for encoding in encodings:
+                compressed = compress(data, encoding, best=True)
+                if len(compressed) < len(data):
+                    self.variants[encoding] = compressed
+
+    def body(self, encoding):
+        """Return (data, encoding) for the requested encoding, or identity."""
+        if encoding in self.variants:
+            return self.variants[encoding], encoding
+        return self.variants[None], None
+
+
+class AssetPipeline:
+    def __init__(self, root):
+        self.root = root
+        self.assets = {}
+
+    def load(self):
+        assets = {}
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                full_path = os.path.join(dirpath, filename)
+                path = os.path.relpath(full_path, self.root).replace(os.sep, "/")
+                with open(full_path, "rb") as f:
+                    assets[path] = Asset(path, f.read())
+        self.assets = assets
+
+    def get(self, path):
+        return self.assets.get(path)
@@ -0,0 +1,343 @@
+import atexit
+import csv
+import os
+import struct
+import threading
+import time
+import weakref
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+
+import pricing
+
+# -------------------------
+# Inventory audit log
+# -------------------------
+# Append-only log of inventory changes. Each entry is a fixed-size binary
+# record, packed into a preallocated in-memory ring buffer. A background
+# thread spills the records to disk segments, so writing an entry costs the
+# request only a struct.pack_into and two array appends.
+#
+# On-disk layout, in <store dir>/audit/:
+#   strings.csv       one string per row; row N (1-based) is string id N.
+#                     Id 0 means "no value".
+#   rec-000000.bin    records 0 .. SEGMENT_RECORDS-1, rec-000001.bin the next
+#                     SEGMENT_RECORDS, and so on. Segments have no header:
+#                     record `seq` lives in segment seq // SEGMENT_RECORDS at
+#                     byte offset (seq % SEGMENT_RECORDS) * RECORD.size.
+#
+# Record (little-endian, 68 bytes):
+#   int64  timestamp, microseconds since the Unix epoch
+#   uint32 medication (string id)
+#   uint32 actor (string id)
+#   uint8  kind (see KINDS), followed by 3 padding bytes
+#   int32  old quantity, int32 new quantity      (NO_QUANTITY if not set)
+#   int64  old price, int64 new price, in cents  (NO_PRICE if not set)
+#   uint32 old expiry, uint32 new expiry         (string ids, 0 if not set)
+#   uint32 old tax rate, uint32 new tax rate     (string ids of the percent, e.g. "8.25")
+#   uint32 old discounts, uint32 new discounts   (string ids of the tiers, e.g. "10:5,50:12.5")
+#
+# Logs written before tax rates and discounts were recorded hold 52-byte
+# records (LEGACY_RECORD, without the last four fields) in seg-*.bin files.
+# load() converts them to rec-*.bin, with the new fields not set.
+
+RECORD = struct.Struct("<qIIB3xiiqqIIIIII")
+LEGACY_RECORD = struct.Struct("<qIIB3xiiqqII")
+SEGMENT_RECORDS = 65536
+NO_QUANTITY = -2 ** 31
+# Largest quantity a record can hold
+MAX_QUANTITY = 2 ** 31 - 1
+NO_PRICE = -2 ** 63
+
+ADD, UPDATE, DELETE, SALE, ALLOCATE, TERMINAL_SALE, CATALOG_SYNC = range(1, 8)
+KINDS = {
+    ADD: "add",
+    UPDATE: "update",
+    DELETE: "delete",
+    SALE: "sale",
+    ALLOCATE: "allocate",
+    TERMINAL_SALE: "terminal_sale",
+    CATALOG_SYNC: "catalog_sync",
+}
+
+FLUSH_INTERVAL = 1.0
+# Records held in memory per log (about 270 KB). The flusher empties the ring
+# every FLUSH_INTERVAL; if a burst fills it first, append() spills inline.
+RING_RECORDS = 4096
+
+
+class AuditLog:
+    def __init__(self, directory, ring_records=RING_RECORDS):
+        self.directory = directory
+        self.ring_records = ring_records
+        self.ring = bytearray(ring_records * RECORD.size)
+        self.count = 0
+        self.flushed = 0
+        # First sequence number held in the ring; earlier records were loaded
+        # from disk at startup and only exist in the segments
+        self.ring_start = 0
+        self.strings = [""]
+        self.string_ids = {"": 0}
+        self.flushed_strings = 1
+        # Indexes: timestamp of every record, and per medication id the
+        # timestamps and sequence numbers of its records (both append-ordered)
+        self.timestamps = array("q")
+        self.by_medication = {}
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        _register(self)
+
+    def load(self):
+        """Read the string table and rebuild the indexes from the segments."""
+        with self.lock:
+            self._upgrade()
+            if os.path.exists(self._strings_path()):
+                # A row cut short by a crash is dropped; no record refers to
+                # it, since strings are written before the records using them
+                _truncate_to(self._strings_path(), b"\n")
+                with open(self._strings_path(), mode="r", newline="") as f:
+                    for row in csv.reader(f):
+                        self.string_ids[row[0]] = len(self.strings)
+                        self.strings.append(row[0])
+            self.flushed_strings = len(self.strings)
+            seq = 0
+            segment = 0
+            while os.path.exists(self._segment_path(segment)):
+                with open(self._segment_path(segment), "rb") as f:
+                    data = f.read()
+                usable = len(data) - len(data) % RECORD.size
+                if usable < len(data):
+                    # A record cut short by a crash; cut it off so the next
+                    # flush appends at the offset its sequence number implies
+                    os.truncate(self._segment_path(segment), usable)
+                for record in RECORD.iter_unpack(memoryview(data)[:usable]):
+                    self._index(seq, record[0], record[1])
+                    seq += 1
+                if usable < SEGMENT_RECORDS * RECORD.size:
+                    break
+                segment += 1
+            self.count = self.flushed = self.ring_start = seq
+
+    # -- writing --
+
+    def append(self, kind, medication, actor, old=None, new=None):
+        """Record a change of one medication; `old`/`new` are inventory item dicts.
+
+        Raises ValueError if a quantity or price does not fit in a record.
+        """
+        while True:
+            with self.lock:
+                if self.count - self.flushed < self.ring_records:
+                    # Never earlier than the last record, even if the clock
+                    # steps back: the indexes are bisected by timestamp
+                    ts = int(time.time() * 1_000_000)
+                    if self.timestamps and ts < self.timestamps[-1]:
+                        ts = self.timestamps[-1]
+                    seq = self.count
+                    med_id = self._intern(medication)
+                    try:
+                        RECORD.pack_into(
+                            self.ring, (seq % self.ring_records) * RECORD.size,
+                            ts, med_id, self._intern(actor or ""), kind,
+                            old["quantity"] if old else NO_QUANTITY, new["quantity"] if new else NO_QUANTITY,
+                            round(old["price"] * 100) if old else NO_PRICE, round(new["price"] * 100) if new else NO_PRICE,
+                            self._intern(old["expiry"]) if old else 0, self._intern(new["expiry"]) if new else 0,
+                            self._intern(str(old["tax_rate"])) if old else 0, self._intern(str(new["tax_rate"])) if new else 0,
+                            self._intern(old["discounts"]) if old else 0, self._intern(new["discounts"]) if new else 0,
+                        )
+                    except struct.error as exc:
+                        raise ValueError(f"value out of range for the audit log: {exc}") from None
+                    self._index(seq, ts, med_id)
+                    self.count = seq + 1
+                    return
+            # The flusher fell a whole ring behind; spill inline rather than
+            # overwrite records that are not on disk yet.
+            self.flush()
+
+    def flush(self):
+        """Write records and strings that are only in memory to disk."""
+        with self.flush_lock:
+            with self.lock:
+                start, end = self.flushed, self.count
+                new_strings = self.strings[self.flushed_strings:]
+                chunks = []
+                seq = start
+                while seq < end:
+                    slot = seq % self.ring_records
+                    n = min(end - seq, self.ring_records - slot)
+                    chunks.append((seq, bytes(self.ring[slot * RECORD.size:(slot + n) * RECORD.size])))
+                    seq += n
+            if start == end and not new_strings:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            # Strings first, so no record on disk refers to an unknown id
+            if new_strings:
+                with open(self._strings_path(), mode="a", newline="") as f:
+                    csv.writer(f).writerows([s] for s in new_strings)
+                    f.flush()
+                    os.fsync(f.fileno())
+            for seq, data in chunks:
+                while data:
+                    segment, offset = divmod(seq, SEGMENT_RECORDS)
+                    n = min(len(data) // RECORD.size, SEGMENT_RECORDS - offset)
+                    with open(self._segment_path(segment), "ab") as f:
+                        f.write(data[:n * RECORD.size])
+                        f.flush()
+                        os.fsync(f.fileno())
+                    data = data[n * RECORD.size:]
+                    seq += n
+            with self.lock:
+                self.flushed = end
+                self.flushed_strings += len(new_strings)
+
+    # -- querying --
+
+    def query(self, medication=None, since=None, until=None, limit=1000):
+        """Entries for `medication` (or all) with since <= time < until, newest first."""
+        lo = int(since.timestamp() * 1_000_000) if since else None
+        hi = int(until.timestamp() * 1_000_000) if until else None
+        with self.lock:
+            if medication is not None:
+                med_id = self.string_ids.get(medication)
+                if med_id is None or med_id not in self.by_medication:
+                    return []
+                timestamps, seqs = self.by_medication[med_id]
+            else:
+                timestamps, seqs = self.timestamps, None
+            first = bisect_left(timestamps, lo) if lo is not None else 0
+            last = bisect_left(timestamps, hi) if hi is not None else len(timestamps)
+            positions = range(last - 1, max(first, last - limit) - 1, -1)
+            wanted = [seqs[i] if seqs is not None else i for i in positions]
+            # Recent records are copied out of the ring now; older ones are
+            # already on disk and immutable, so they are read after the lock
+            # is released and never stall writers.
+            in_ring = max(self.count - self.ring_records, self.ring_start)
+            records = [RECORD.unpack_from(self.ring, (seq % self.ring_records) * RECORD.size) if seq >= in_ring else seq
+                       for seq in wanted]
+            strings = self.strings
+        self._read_segments(records)
+        return [self._entry(record, strings) for record in records]
+
+    def _read_segments(self, records):
+        """Replace the sequence numbers left in `records` with records read from disk."""
+        handles = {}
+        try:
+            for i, seq in enumerate(records):
+                if not isinstance(seq, int):
+                    continue
+                segment, offset = divmod(seq, SEGMENT_RECORDS)
+                f = handles.get(segment)
+                if f is None:
+                    f = handles[segment] = open(self._segment_path(segment), "rb")
+                f.seek(offset * RECORD.size)
+                records[i] = RECORD.unpack(f.read(RECORD.size))
+        finally:
+            for f in handles.values():
+                f.close()
+
+    @staticmethod
+    def _entry(record, strings):
+        (ts, med_id, actor_id, kind, old_qty, new_qty, old_price, new_price, old_expiry, new_expiry,
+         old_tax_rate, new_tax_rate, old_discounts, new_discounts) = record
+        return {
+            "time": datetime.fromtimestamp(ts / 1_000_000).isoformat(timespec="microseconds"),
+            "kind": KINDS.get(kind, str(kind)),
+            "medication": strings[med_id],
+            "actor": strings[actor_id] or None,
+            "old_quantity": None if old_qty == NO_QUANTITY else old_qty,
+            "new_quantity": None if new_qty == NO_QUANTITY else new_qty,
+            # Decimal strings, like every other amount the API returns
+            "old_price": None if old_price == NO_PRICE else str(pricing.from_cents(old_price)),
+            "new_price": None if new_price == NO_PRICE else str(pricing.from_cents(new_price)),
+            "old_expiry": strings[old_expiry] or None,
+            "new_expiry": strings[new_expiry] or None,
+            "old_tax_rate": strings[old_tax_rate] or None,
+            "new_tax_rate": strings[new_tax_rate] or None,
+            "old_discounts": strings[old_discounts] or None,
+            "new_discounts": strings[new_discounts] or None,
+        }
+
+    # -- internals --
+
+    def _intern(self, value):
+        string_id = self.string_ids.get(value)
+        if string_id is None:
+            string_id = self.string_ids[value] = len(self.strings)
+            self.strings.append(value)
+        return string_id
+
+    def _index(self, seq, ts, med_id):
+        self.timestamps.append(ts)
+        entry = self.by_medication.get(med_id)
+        if entry is None:
+            entry = self.by_medication[med_id] = (array("q"), array("q"))
+        entry[0].append(ts)
+        entry[1].append(seq)
+
+    def _strings_path(self):
+        return os.path.join(self.directory, "strings.csv")
+
+    def _upgrade(self):
+        """Convert segments in the LEGACY_RECORD layout to the current one."""
+        count = 0
+        while os.path.exists(self._legacy_segment_path(count)):
+            with open(self._legacy_segment_path(count), "rb") as f:
+                data = f.read()
+            usable = len(data) - len(data) % LEGACY_RECORD.size
+            tmp_path = self._segment_path(count) + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(b"".join(RECORD.pack(*record, 0, 0, 0, 0)
+                                 for record in LEGACY_RECORD.iter_unpack(memoryview(data)[:usable])))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self._segment_path(count))
+            count += 1
+        # Last segment first: if this is interrupted, the legacy segments
+        # left over still start at 0 and are converted again on next load
+        for segment in reversed(range(count)):
+            os.remove(self._legacy_segment_path(segment))
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, f"rec-{segment:06d}.bin")
+
+    def _legacy_segment_path(self, segment):
+        return os.path.join(self.directory, f"seg-{segment:06d}.bin")
+
+
+def _truncate_to(path, terminator):
+    """Cut `path` back to just after the last `terminator` byte sequence."""
+    with open(path, "rb") as f:
+        data = f.read()
+    end = data.rfind(terminator) + len(terminator)
+    if end < len(data):
+        os.truncate(path, end)
+
+
+# One background thread spills every open log to disk
+_logs = weakref.WeakSet()
+_flusher = None
+_flusher_lock = threading.Lock()
+
+
+def _register(log):
+    global _flusher
+    _logs.add(log)
+    with _flusher_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_forever, name="audit-flusher", daemon=True)
+            _flusher.start()
+
+
+def _flush_forever():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        flush_all()
+
+
+def flush_all():
+    for log in list(_logs):
+        log.flush()
+
+
+atexit.register(flush_all)
@@ -0,0 +1,136 @@
+"""Checkout throughput of the sync (Flask) and async (Quart) servers.
+
+Starts each server on a fresh data directory, stocks one medication and has
+`--terminals` concurrent clients post sales to /sell, like that many counter
+terminals ringing up sales at once. Prints requests per second and latency
+percentiles, and checks that every sale took exactly its stock.
+
+    python benchmarks/bench_checkout.py --terminals 50 --sales 40
+
+Needs flask, and quart + hypercorn for the async server. Point --data-dir at
+a slow disk (e.g. a network mount) to see the effect of blocking writes.
+"""
+import argparse
+import http.client
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVERS = {
+    "sync": "pharmacy_pos.py",
+    "async": "pharmacy_pos_async.py",
+}
+MEDICATION = "Benchmarkol"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with status {process.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+def post_form(conn, path, fields):
+    body = urllib.parse.urlencode(fields)
+    conn.request("POST", path, body, {"Content-Type": "application/x-www-form-urlencoded"})
+    response = conn.getresponse()
+    data = response.read()
+    return response.status, data
+
+
+def terminal(port, sales):
+    """Post `sales` single-unit sales over one connection; returns latencies in seconds."""
+    latencies = []
+    errors = 0
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    for _ in range(sales):
+        start = time.perf_counter()
+        try:
+            status, data = post_form(conn, "/sell", {"name": MEDICATION, "quantity": "1"})
+        except (OSError, http.client.HTTPException):
+            # The sync dev server may close the connection; reconnect
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+        if status != 200 or b"Sold 1" not in data:
+            errors += 1
+    conn.close()
+    return latencies, errors
+
+
+def percentile(values, p):
+    if not values:
+        return float("nan")
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def run(kind, args):
+    port = free_port()
+    data_dir = tempfile.mkdtemp(prefix=f"bench-{kind}-", dir=args.data_dir)
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, SERVERS[kind]), "--port", str(port), "--data-dir", data_dir],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_up(port, process)
+        stock = args.terminals * args.sales
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        post_form(conn, "/inventory", {"name": MEDICATION, "price": "2.50", "quantity": str(stock), "expiry": "2099-12-31"})
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.terminals) as pool:
+            results = list(pool.map(lambda _: terminal(port, args.sales), range(args.terminals)))
+        elapsed = time.perf_counter() - start
+        conn.request("GET", "/api/inventory")
+        left = json.loads(conn.getresponse().read())["items"][MEDICATION]["quantity"]
+        conn.close()
+    finally:
+        process.terminate()
+        process.wait()
+        shutil.rmtree(data_dir, ignore_errors=True)
+    latencies = sorted(latency for result in results for latency in result[0])
+    errors = sum(result[1] for result in results)
+    sold = stock - left
+    print(f"{kind:>5}: {len(latencies) / elapsed:8.1f} req/s  "
+          f"p50 {percentile(latencies, 50) * 1000:7.1f} ms  "
+          f"p95 {percentile(latencies, 95) * 1000:7.1f} ms  "
+          f"p99 {percentile(latencies, 99) * 1000:7.1f} ms  "
+          f"errors {errors}  stock sold {sold}/{len(latencies) - errors}"
+          + ("" if sold == len(latencies) - errors else "  MISMATCH"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--terminals", type=int, default=50, help="concurrent clients")
+    parser.add_argument("--sales", type=int, default=40, help="sales per client")
+    parser.add_argument("--data-dir", help="parent directory for the servers' data (default: system temp)")
+    parser.add_argument("--only", choices=sorted(SERVERS), help="benchmark one server only")
+    args = parser.parse_args()
+    print(f"{args.terminals} terminals x {args.sales} sales")
+    for kind in SERVERS:
+        if args.only in (None, kind):
+            run(kind, args)
+
+
+if __name__ == "__main__":
+    main()
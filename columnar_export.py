@@ -0,0 +1,241 @@
+import calendar
+import struct
+import sys
+from array import array
+from decimal import Decimal
+
+try:
+    import pyarrow as pa
+except ImportError:  # pyarrow is optional; the PCOL format needs only the stdlib
+    pa = None
+
+# -------------------------
+# Columnar export
+# -------------------------
+# Typed, column-oriented exports of sales and inventory for analytics.
+# Two formats are supported:
+#
+# * "arrow": the Apache Arrow IPC streaming format (needs pyarrow).
+# * "pcol": a small self-describing binary format that needs only the stdlib,
+#   used when pyarrow is not installed. All integers are little-endian.
+#
+#     stream  := b"PCOL" uint8 version(=2) uint16 ncolumns column* batch* end
+#     column  := uint8 type uint16 name_length name(utf-8)
+#     batch   := uint32 nrows (> 0) data(column 1) .. data(column n)
+#     end     := uint32 0
+#
+#   Column data by type code, nrows values each:
+#     1 int32     int32[nrows]
+#     2 int64     int64[nrows]
+#     3 float64   float64[nrows]
+#     4 bool      uint8[nrows], 0 or 1
+#     5 utf8      uint32 offsets[nrows + 1], then offsets[nrows] bytes of utf-8
+#     6 timestamp int64[nrows], microseconds since 1970-01-01 (naive local time)
+#     7 date32    int32[nrows], days since 1970-01-01; NULL_DATE if missing
+#     8 money     int64[nrows], whole cents (Arrow: decimal128(12, 2))
+#     9 percent   int32[nrows], ten-thousandths of a percent, e.g. 82500 for
+#                 8.25% (Arrow: decimal128(7, 4))
+#
+#   Version 2 added types 8 and 9 and exports money and percentages with
+#   them instead of float64, so amounts arrive exact. read_pcol() returns
+#   them as Decimals. It still reads version 1 streams.
+#
+# Sales carry a `seq` column, the row's position in the store's sales log.
+# An export of sales with seq >= since returns the next watermark (one past
+# the last row exported), so nightly jobs can fetch only new sales.
+
+INT32, INT64, FLOAT64, BOOL, UTF8, TIMESTAMP, DATE32, MONEY, PERCENT = range(1, 10)
+PCOL_VERSION = 2
+NULL_DATE = -2 ** 31
+BATCH_ROWS = 8192
+
+SALES_COLUMNS = [
+    ("seq", INT64),
+    ("medication", UTF8),
+    ("quantity", INT32),
+    ("total", MONEY),
+    ("prescription_id", UTF8),
+    ("sold_at", TIMESTAMP),
+]
+INVENTORY_COLUMNS = [
+    ("name", UTF8),
+    ("price", MONEY),
+    ("quantity", INT32),
+    ("expiry", DATE32),
+    ("prescription_required", BOOL),
+    ("tax_rate", PERCENT),
+    ("discounts", UTF8),
+]
+
+ARROW_MIMETYPE = "application/vnd.apache.arrow.stream"
+PCOL_MIMETYPE = "application/x-pharmacy-columnar"
+
+_ARRAY_CODES = {INT32: "i", INT64: "q", FLOAT64: "d", BOOL: "B", TIMESTAMP: "q", DATE32: "i", MONEY: "q", PERCENT: "i"}
+# Decimal places of the fixed-point types: stored integer = value * 10**places
+_DECIMAL_PLACES = {MONEY: 2, PERCENT: 4}
+_NEEDS_SWAP = sys.byteorder != "little"
+
+
+def formats():
+    return ["arrow", "pcol"] if pa is not None else ["pcol"]
+
+
+def mimetype(fmt):
+    return ARROW_MIMETYPE if fmt == "arrow" else PCOL_MIMETYPE
+
+
+def timestamp_us(text):
+    """'YYYY-MM-DD HH:MM:SS' to microseconds since the epoch, without strptime."""
+    seconds = calendar.timegm((int(text[0:4]), int(text[5:7]), int(text[8:10]),
+                               int(text[11:13]), int(text[14:16]), int(text[17:19])))
+    return seconds * 1_000_000
+
+
+def date_days(text):
+    if not text:
+        return NULL_DATE
+    return calendar.timegm((int(text[0:4]), int(text[5:7]), int(text[8:10]), 0, 0, 0)) // 86400
+
+
+def sales_batches(sales, start, batch_rows=BATCH_ROWS):
+    """Yield column lists for `sales` (rows starting at log position `start`)."""
+    for offset in range(0, len(sales), batch_rows):
+        rows = sales[offset:offset + batch_rows]
+        first = start + offset
+        yield [
+            list(range(first, first + len(rows))),
+            [row[0] for row in rows],
+            [row[1] for row in rows],
+            [row[2] for row in rows],
+            [row[3] for row in rows],
+            [timestamp_us(row[4]) for row in rows],
+        ]
+
+
+def inventory_batches(items, batch_rows=BATCH_ROWS):
+    for offset in range(0, len(items), batch_rows):
+        rows = items[offset:offset + batch_rows]
+        yield [
+            [name for name, _ in rows],
+            [item["price"] for _, item in rows],
+            [item["quantity"] for _, item in rows],
+            [date_days(item["expiry"]) for _, item in rows],
+            [item["prescription_required"] for _, item in rows],
+            [item["tax_rate"] for _, item in rows],
+            [item["discounts"] for _, item in rows],
+        ]
+
+
+def stream(columns, batches, fmt):
+    if fmt == "arrow":
+        return _arrow_stream(columns, batches)
+    return _pcol_stream(columns, batches)
+
+
+# -- PCOL --
+
+def _pack_column(kind, values):
+    if kind == UTF8:
+        encoded = [value.encode("utf-8") for value in values]
+        offsets = array("I", [0])
+        total = 0
+        for item in encoded:
+            total += len(item)
+            offsets.append(total)
+        if _NEEDS_SWAP:
+            offsets.byteswap()
+        return offsets.tobytes() + b"".join(encoded)
+    if kind in _DECIMAL_PLACES:
+        # Exact: amounts never have more decimals than their type
+        places = _DECIMAL_PLACES[kind]
+        values = [int(Decimal(value).scaleb(places)) for value in values]
+    data = array(_ARRAY_CODES[kind], values)
+    if _NEEDS_SWAP:
+        data.byteswap()
+    return data.tobytes()
+
+
+def _pcol_stream(columns, batches):
+    header = [b"PCOL", struct.pack("<BH", PCOL_VERSION, len(columns))]
+    for name, kind in columns:
+        encoded = name.encode("utf-8")
+        header.append(struct.pack("<BH", kind, len(encoded)) + encoded)
+    yield b"".join(header)
+    for batch in batches:
+        yield struct.pack("<I", len(batch[0])) + b"".join(
+            _pack_column(kind, values) for (_, kind), values in zip(columns, batch))
+    yield struct.pack("<I", 0)
+
+
+def read_pcol(f):
+    """Read a PCOL stream from a binary file object into {column: [values]}."""
+    if f.read(4) != b"PCOL":
+        raise ValueError("not a PCOL stream")
+    version, ncolumns = struct.unpack("<BH", f.read(3))
+    if version not in (1, PCOL_VERSION):
+        raise ValueError(f"unsupported PCOL version {version}")
+    columns = []
+    for _ in range(ncolumns):
+        kind, length = struct.unpack("<BH", f.read(3))
+        columns.append((f.read(length).decode("utf-8"), kind))
+    result = {name: [] for name, _ in columns}
+    while True:
+        (nrows,) = struct.unpack("<I", f.read(4))
+        if nrows == 0:
+            return result
+        for name, kind in columns:
+            if kind == UTF8:
+                offsets = array("I")
+                offsets.frombytes(f.read(4 * (nrows + 1)))
+                if _NEEDS_SWAP:
+                    offsets.byteswap()
+                data = f.read(offsets[-1])
+                result[name].extend(data[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(nrows))
+                continue
+            values = array(_ARRAY_CODES[kind])
+            values.frombytes(f.read(values.itemsize * nrows))
+            if _NEEDS_SWAP:
+                values.byteswap()
+            if kind == BOOL:
+                result[name].extend(bool(v) for v in values)
+            elif kind == DATE32:
+                result[name].extend(None if v == NULL_DATE else v for v in values)
+            elif kind in _DECIMAL_PLACES:
+                places = _DECIMAL_PLACES[kind]
+                result[name].extend(Decimal(v).scaleb(-places) for v in values)
+            else:
+                result[name].extend(values)
+
+
+# -- Arrow --
+
+def _arrow_type(kind):
+    return {
+        INT32: pa.int32(),
+        INT64: pa.int64(),
+        FLOAT64: pa.float64(),
+        BOOL: pa.bool_(),
+        UTF8: pa.string(),
+        TIMESTAMP: pa.timestamp("us"),
+        DATE32: pa.date32(),
+        MONEY: pa.decimal128(12, 2),
+        PERCENT: pa.decimal128(7, 4),
+    }[kind]
+
+
+# An IPC stream is the schema message, one message per record batch and an
+# end-of-stream marker, so each piece can be yielded as soon as it is built.
+ARROW_EOS = b"\xff\xff\xff\xff\x00\x00\x00\x00"
+
+
+def _arrow_stream(columns, batches):
+    schema = pa.schema([(name, _arrow_type(kind)) for name, kind in columns])
+    yield schema.serialize().to_pybytes()
+    for batch in batches:
+        arrays = []
+        for (_, kind), values in zip(columns, batch):
+            if kind == DATE32:
+                values = [None if v == NULL_DATE else v for v in values]
+            arrays.append(pa.array(values, type=_arrow_type(kind)))
+        yield pa.record_batch(arrays, schema=schema).serialize().to_pybytes()
+    yield ARROW_EOS
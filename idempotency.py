@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import OrderedDict
+
+# -------------------------
+# Idempotency cache
+# -------------------------
+# Remembers the response of recent POSTs by client-supplied key so a retried
+# request (double click, network hiccup) is replayed instead of re-applied.
+
+
+class IdempotencyConflict(Exception):
+    """Another request with the same key is still being processed."""
+
+
+class IdempotencyMismatch(Exception):
+    """The key was already used for a request with a different body."""
+
+
+class _Entry:
+    __slots__ = ("expires_at", "fingerprint", "value", "done", "event")
+
+    def __init__(self, expires_at, fingerprint):
+        self.expires_at = expires_at
+        self.fingerprint = fingerprint
+        self.value = None
+        self.done = False
+        self.event = threading.Event()
+
+
+class IdempotencyCache:
+    """Bounded LRU of idempotency keys whose results expire after `ttl` seconds."""
+
+    def __init__(self, max_entries=2048, ttl=15 * 60, wait_timeout=30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def begin(self, key, fingerprint=None):
+        """Claim `key` or return its stored result.
+
+        Returns None when the caller now owns the key and must call finish()
+        or discard(). Returns the stored value when the key already completed.
+        If the key is in flight, waits for it and raises IdempotencyConflict
+        if it does not complete within `wait_timeout`. `fingerprint`
+        identifies the request body; reusing a key with a different one
+        raises IdempotencyMismatch instead of replaying the other request.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                entry = self._entries.get(key)
+                if entry is not None and entry.done and entry.expires_at <= now:
+                    del self._entries[key]
+                    entry = None
+                if entry is None:
+                    self._entries[key] = _Entry(now + self.ttl, fingerprint)
+                    self._evict(now)
+                    return None
+                if entry.fingerprint != fingerprint:
+                    raise IdempotencyMismatch(key)
+                if entry.done:
+                    self._entries.move_to_end(key)
+                    return entry.value
+                event = entry.event
+            if not event.wait(self.wait_timeout):
+                raise IdempotencyConflict(key)
+
+    def finish(self, key, value):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry.value = value
+            entry.done = True
+            entry.event.set()
+
+    def discard(self, key):
+        """Forget an in-flight key so a retry runs again (e.g. the handler failed)."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is not None:
+            entry.event.set()
+
+    def _evict(self, now):
+        # Drop expired and least recently used completed entries. In-flight
+        # entries are kept; their number is bounded by concurrent requests.
+        excess = len(self._entries) - self.max_entries
+        victims = []
+        for key, entry in self._entries.items():
+            if not entry.done:
+                continue
+            if excess > 0:
+                victims.append(key)
+                excess -= 1
+            elif entry.expires_at <= now:
+                victims.append(key)
+            else:
+                break
+        for key in victims:
+            del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
@@ -1,65 +1,616 @@
-from flask import Flask, render_template, request, send_file
+from flask import Flask, render_template, request, send_file, redirect, url_for, jsonify
 from jinja2 import DictLoader
+from werkzeug.exceptions import abort
+import argparse
 import csv
+import functools
+import hashlib
+import io
+import json
 import random
+import re
 import string
 import os
+import threading
+import uuid
+import zlib
 from collections import defaultdict
 from datetime import datetime
+from decimal import Decimal
+import audit_log
+import columnar_export
+import pricing
+from assets import AssetPipeline, COMPRESSIBLE_TYPES, MIN_COMPRESS_SIZE, compress, negotiate_encoding
+from idempotency import IdempotencyCache, IdempotencyConflict, IdempotencyMismatch
+from routing import Body, File, Json, Page, Redirect, RequestData, RouteTable, Stream
+from terminal_sync import SaleQueue, TerminalLedger, TerminalSync, decompress_body
 
-app = Flask(__name__)
+# Static files are served by the asset pipeline under /assets/<hash>/
+app = Flask(__name__, static_folder=None)
 
 # -------------------------
 # Data
 # -------------------------
-inventory_file = "inventory.csv"
-sales_file = "sales.csv"
+# The default store keeps the original root-level files so existing
+# single-branch deployments keep working unchanged.
+DEFAULT_STORE = "main"
+data_dir = ""
+stores_dir = "stores"
 
-inventory = {}
-sales = []
+STORE_NAME_RE = re.compile(r"^[a-z0-9][a-z0-9_-]{0,31}$")
+# First path segments used by two-segment routes; a store with one of these
+# names would be shadowed by them.
+RESERVED_STORE_NAMES = {"api", "assets", "export", "reports", "stores"}
+# Inventory fields a memoized price schedule depends on
+PRICING_FIELDS = {"price", "tax_rate", "discounts"}
+# Edits are appended to the inventory journal; inventory.csv is rewritten
+# only once the journal holds more entries than this or than the inventory
+# has medications, so each edit costs O(1) amortized instead of a full rewrite.
+JOURNAL_MIN_ENTRIES = 1024
+# Last field of every journal row; a row without it was cut short by a crash
+JOURNAL_END = "."
+# Prices and tax rates are held as exact Decimals, e.g. Decimal("4.50") and
+# Decimal("8.25"), validated by pricing.parse_price()/parse_percent()
+NO_TAX = Decimal(0)
+
+
+def _item_fields(data):
+    return [data["price"], data["quantity"], data["expiry"], data["prescription_required"], data["tax_rate"], data["discounts"]]
+
+def _parse_item(row):
+    """An inventory item from the fields after the name in an inventory.csv or journal row."""
+    return {
+        "price": pricing.parse_price(row[0]),
+        "quantity": int(row[1]),
+        "expiry": row[2],
+        "prescription_required": row[3] == "True",
+        # Pricing rules were added later; older files lack the columns
+        "tax_rate": pricing.parse_percent(row[4]) if len(row) > 4 and row[4] else NO_TAX,
+        "discounts": row[5] if len(row) > 5 else "",
+    }
+
+
+class Store:
+    """One pharmacy branch: its own inventory, sales, files and lock."""
+
+    def __init__(self, name, data_dir):
+        self.name = name
+        self.inventory_file = os.path.join(data_dir, "inventory.csv")
+        self.sales_file = os.path.join(data_dir, "sales.csv")
+        self.journal_file = os.path.join(data_dir, "inventory.journal.csv")
+        self.journal_entries = 0
+        self.inventory = {}
+        self.sales = []
+        # Running rollup so dashboards and cross-store reports never rescan sales
+        self.revenue_by_medication = defaultdict(Decimal)
+        self.total_revenue = Decimal("0.00")
+        # Memoized price schedules; invalidated by the medication mutators
+        self.prices = pricing.PriceCache()
+        self.lock = threading.RLock()
+        # Inventory version counters for ETags: `version` bumps on every
+        # change, `item_versions[name]` records the version of the last
+        # change to that medication. `epoch` keeps ETags from colliding
+        # across restarts, when the counters start again from zero.
+        self.epoch = uuid.uuid4().hex[:8]
+        self.version = 0
+        self.item_versions = {}
+        self.audit = audit_log.AuditLog(os.path.join(data_dir, "audit"))
+        # Central side of offline terminal mode
+        self.terminals = TerminalLedger(data_dir)
+        # Set in terminal mode: sales are appended to this durable queue
+        # instead of rewriting sales.csv
+        self.sale_queue = None
+
+    def load_inventory(self):
+        self.inventory = {}
+        if os.path.exists(self.inventory_file):
+            with open(self.inventory_file, mode="r", newline="") as f:
+                reader = csv.reader(f)
+                for row in reader:
+                    if row:
+                        self.inventory[row[0]] = _parse_item(row[1:])
+        self.journal_entries = 0
+        if os.path.exists(self.journal_file):
+            with open(self.journal_file, mode="rb") as f:
+                data = f.read()
+            # Drop a line cut short by a crash, so later appends start on a line of their own
+            end = data.rfind(b"\n") + 1
+            if end < len(data):
+                os.truncate(self.journal_file, end)
+            for row in csv.reader(io.StringIO(data[:end].decode("utf-8"), newline="")):
+                if not row or row[-1] != JOURNAL_END:
+                    continue
+                if row[0] == "set" and len(row) == 9:
+                    self.inventory[row[1]] = _parse_item(row[2:8])
+                elif row[0] == "del" and len(row) == 3:
+                    self.inventory.pop(row[1], None)
+                self.journal_entries += 1
+        self.prices.clear()
+
+    def load_sales(self):
+        self.sales = []
+        self.revenue_by_medication = defaultdict(Decimal)
+        self.total_revenue = Decimal("0.00")
+        if self.sale_queue is not None:
+            for sale in self.sale_queue.sales():
+                self._add_sale(sale)
+        elif os.path.exists(self.sales_file):
+            with open(self.sales_file, mode="r", newline="") as f:
+                reader = csv.reader(f)
+                for row in reader:
+                    if row:
+                        self._add_sale([row[0], int(row[1]), pricing.money(row[2]), row[3], row[4]])
+
+    def save_inventory(self):
+        """Rewrite inventory.csv from memory and empty the journal; the caller holds the lock."""
+        _ensure_parent_dir(self.inventory_file)
+        tmp_file = self.inventory_file + ".tmp"
+        with open(tmp_file, mode="w", newline="") as f:
+            writer = csv.writer(f)
+            for name, data in self.inventory.items():
+                writer.writerow([name] + _item_fields(data))
+        os.replace(tmp_file, self.inventory_file)
+        # Replaying the journal over the new file is harmless, so a crash
+        # before this point loses nothing
+        if os.path.exists(self.journal_file):
+            os.remove(self.journal_file)
+        self.journal_entries = 0
+
+    def save_items(self, *names):
+        """Persist the current state of `names` by appending it to the journal; the caller holds the lock."""
+        if not names:
+            return
+        _ensure_parent_dir(self.journal_file)
+        with open(self.journal_file, mode="a", newline="") as f:
+            writer = csv.writer(f)
+            for name in names:
+                data = self.inventory.get(name)
+                if data is None:
+                    writer.writerow(["del", name, JOURNAL_END])
+                else:
+                    writer.writerow(["set", name] + _item_fields(data) + [JOURNAL_END])
+        self.journal_entries += len(names)
+        if self.journal_entries > max(JOURNAL_MIN_ENTRIES, len(self.inventory)):
+            self.save_inventory()
+
+    def append_sales(self, sales):
+        """Append newly recorded sales to sales.csv; earlier rows are never rewritten."""
+        _ensure_parent_dir(self.sales_file)
+        with open(self.sales_file, mode="a", newline="") as f:
+            csv.writer(f).writerows(sales)
+
+    def save_sale(self, sale):
+        """Persist a newly recorded sale."""
+        if self.sale_queue is not None:
+            self.sale_queue.append(sale)
+        else:
+            self.append_sales([sale])
+
+    def touch(self, name):
+        self.version += 1
+        if name in self.inventory:
+            self.item_versions[name] = self.version
+        else:
+            self.item_versions.pop(name, None)
+
+    def etag(self, name=None):
+        if name is None:
+            return f"{self.name}-{self.epoch}-{self.version}"
+        return f"{self.name}-{self.epoch}-{self.item_versions.get(name, 0)}"
+
+    def add_medication(self, name, price, quantity, expiry, prescription_required, actor=None, tax_rate=NO_TAX, discounts=""):
+        with self.lock:
+            old = self.inventory.get(name)
+            new = {"price": price, "quantity": quantity, "expiry": expiry, "prescription_required": prescription_required,
+                   "tax_rate": tax_rate, "discounts": discounts}
+            # Audit first: if the record cannot be written, nothing has changed
+            self.audit.append(audit_log.ADD, name, actor, old, new)
+            self.inventory[name] = new
+            self.prices.invalidate(name)
+            self.touch(name)
+            self.save_items(name)
+
+    def update_medication(self, name, actor=None, **changes):
+        """Update fields (price, quantity, expiry, pricing rules) of an existing medication; False if unknown."""
+        with self.lock:
+            item = self.inventory.get(name)
+            if item is None:
+                return False
+            self.audit.append(audit_log.UPDATE, name, actor, item, dict(item, **changes))
+            item.update(changes)
+            if changes.keys() & PRICING_FIELDS:
+                self.prices.invalidate(name)
+            self.touch(name)
+            self.save_items(name)
+            return True
+
+    def delete_medication(self, name, actor=None):
+        with self.lock:
+            old = self.inventory.get(name)
+            if old is None:
+                return False
+            self.audit.append(audit_log.DELETE, name, actor, old, None)
+            del self.inventory[name]
+            self.prices.invalidate(name)
+            self.touch(name)
+            self.save_items(name)
+            return True
+
+    def _add_sale(self, sale):
+        self.sales.append(sale)
+        self.revenue_by_medication[sale[0]] += sale[2]
+        self.total_revenue += sale[2]
+
+    def record_sale(self, name, qty, total, prescription_id, timestamp=None):
+        sale = [name, qty, total, prescription_id, timestamp or datetime.now().strftime('%Y-%m-%d %H:%M:%S')]
+        self._add_sale(sale)
+        return sale
+
+    def quote(self, name, qty):
+        """Exact price of `qty` units of `name` (a pricing.Quote); the caller holds the lock."""
+        return self.prices.quote(name, self.inventory[name], qty)
+
+    def rollup(self):
+        """Summary of this store for the dashboard and cross-store reports."""
+        with self.lock:
+            return {
+                "name": self.name,
+                "num_products": len(self.inventory),
+                "total_sales": len(self.sales),
+                "total_revenue": self.total_revenue,
+                "expiring_soon": count_expiring(self.inventory),
+                "revenue_by_medication": dict(self.revenue_by_medication),
+            }
+
+
+stores = {}
+stores_lock = threading.Lock()
+# Set once load_stores() has opened every branch on disk
+stores_loaded = False
+load_lock = threading.Lock()
+
+static_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+assets = AssetPipeline(static_dir)
+assets.load()
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+# Results of recent sell/inventory POSTs, keyed by (path, idempotency key)
+idempotency_cache = IdempotencyCache()
+MAX_IDEMPOTENCY_KEY_LENGTH = 128
 
 # -------------------------
 # Helpers
 # -------------------------
-def load_inventory():
-    global inventory
-    if os.path.exists(inventory_file):
-        with open(inventory_file, mode="r", newline="") as f:
-            reader = csv.reader(f)
-            for row in reader:
-                if row:
-                    inventory[row[0]] = {
-                        "price": float(row[1]),
-                        "quantity": int(row[2]),
-                        "expiry": row[3],
-                        "prescription_required": row[4] == "True"
-                    }
-
-def load_sales():
-    global sales
-    sales = []
-    if os.path.exists(sales_file):
-        with open(sales_file, mode="r", newline="") as f:
-            reader = csv.reader(f)
-            for row in reader:
-                if row:
-                    sales.append([row[0], int(row[1]), float(row[2]), row[3], row[4]])
-
-def save_inventory():
-    with open(inventory_file, mode="w", newline="") as f:
-        writer = csv.writer(f)
-        for name, data in inventory.items():
-            writer.writerow([name, data["price"], data["quantity"], data["expiry"], data["prescription_required"]])
-
-def save_sales():
-    with open(sales_file, mode="w", newline="") as f:
-        writer = csv.writer(f)
-        for sale in sales:
-            writer.writerow(sale)
+def _ensure_parent_dir(path):
+    parent = os.path.dirname(path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+
+def store_dir(name):
+    if name == DEFAULT_STORE:
+        return data_dir
+    return os.path.join(data_dir, stores_dir, name)
+
+def open_store(name):
+    with stores_lock:
+        store = stores.get(name)
+        if store is None:
+            store = Store(name, store_dir(name))
+            store.load_inventory()
+            store.load_sales()
+            store.terminals.load()
+            store.audit.load()
+            stores[name] = store
+        return store
+
+def load_stores():
+    global stores_loaded
+    open_store(DEFAULT_STORE)
+    root = os.path.join(data_dir, stores_dir)
+    if os.path.isdir(root):
+        for name in sorted(os.listdir(root)):
+            if STORE_NAME_RE.match(name) and os.path.isdir(os.path.join(root, name)):
+                open_store(name)
+    stores_loaded = True
+
+def ensure_stores():
+    """Load the stores on first use; `flask run` and WSGI servers never run __main__."""
+    if not stores_loaded:
+        with load_lock:
+            if not stores_loaded:
+                load_stores()
+
+def create_store(name):
+    # The default store always exists and its files live in data_dir itself,
+    # not under stores/, so it cannot be created again
+    if not STORE_NAME_RE.match(name) or name in RESERVED_STORE_NAMES or name == DEFAULT_STORE:
+        return None
+    os.makedirs(store_dir(name), exist_ok=True)
+    return open_store(name)
+
+def get_store(name):
+    ensure_stores()
+    store = stores.get(name or DEFAULT_STORE)
+    if store is None:
+        abort(404)
+    return store
+
+def count_expiring(inventory, days=30):
+    return sum(1 for item in inventory.values() if item['expiry'] and (datetime.strptime(item['expiry'], '%Y-%m-%d') - datetime.now()).days <= days)
+
+def idempotent(handler):
+    """Replay the stored reply when a POST repeats an idempotency key.
+
+    The key comes from the `Idempotency-Key` header (API clients) or the
+    hidden `idempotency_key` form field filled in by the page script. A key
+    reused with a different method or body is rejected with 422.
+    """
+    @functools.wraps(handler)
+    def wrapper(req, **kwargs):
+        key = req.headers.get("Idempotency-Key") or req.form.get("idempotency_key")
+        if req.method == "GET" or not key:
+            return handler(req, **kwargs)
+        if len(key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+            return Body("Error: idempotency key is too long.", status=400)
+        cache_key = (req.path, key)
+        fingerprint = hashlib.sha256(req.method.encode() + b"\0" + req.body).hexdigest()
+        try:
+            stored = idempotency_cache.begin(cache_key, fingerprint)
+        except IdempotencyConflict:
+            return Body("Error: this request is still being processed.", status=409)
+        except IdempotencyMismatch:
+            return Body("Error: this idempotency key was already used for a different request.", status=422)
+        if stored is not None:
+            return stored.replayed()
+        try:
+            reply = handler(req, **kwargs)
+        except BaseException:
+            idempotency_cache.discard(cache_key)
+            raise
+        # Rejected requests changed nothing; let a corrected retry run again
+        if reply.status >= 400 or reply.streamed:
+            idempotency_cache.discard(cache_key)
+        else:
+            idempotency_cache.finish(cache_key, reply.remembered())
+        return reply
+    return wrapper
+
+@app.template_global()
+def asset_url(path):
+    return url_for("asset", digest=assets.get(path).digest, filename=path)
+
+def warm_templates(jinja_env=None):
+    # Compile every in-memory template once at startup instead of on the
+    # first request that renders it; DictLoader sources never change.
+    jinja_env = jinja_env or app.jinja_env
+    jinja_env.auto_reload = False
+    for name in jinja_env.list_templates():
+        jinja_env.get_template(name)
 
 def generate_prescription_id():
     return ''.join(random.choices(string.ascii_uppercase + string.digits, k=12))
 
+# -------------------------
+# Services
+# -------------------------
+# Route logic that does not depend on the web framework. These take the
+# store lock and write files themselves; templates only ever see snapshots
+# copied under the lock.
+def dashboard(store):
+    summary = store.rollup()
+    return {
+        "num_products": summary["num_products"],
+        "total_sales": summary["total_sales"],
+        "total_revenue": summary["total_revenue"],
+        "expiring_soon": summary["expiring_soon"],
+        "labels": list(summary["revenue_by_medication"].keys()),
+        # Chart heights only; the exact amounts are shown as text
+        "data": [float(revenue) for revenue in summary["revenue_by_medication"].values()],
+    }
+
+def parse_pricing_rules(fields):
+    """Validated tax_rate/discounts from a form or JSON body; ValueError if malformed."""
+    rules = {}
+    if fields.get("tax_rate") not in (None, ""):
+        rules["tax_rate"] = pricing.parse_percent(fields["tax_rate"])
+    if fields.get("discounts") is not None:
+        rules["discounts"] = pricing.normalize_discounts(fields["discounts"])
+    return rules
+
+def parse_quantity(value, minimum=0):
+    """A stock or sale quantity; ValueError unless an integer from `minimum` to what the audit log can record."""
+    quantity = int(value)
+    if not minimum <= quantity <= audit_log.MAX_QUANTITY:
+        raise ValueError(f"quantity must be between {minimum} and {audit_log.MAX_QUANTITY}")
+    return quantity
+
+def parse_expiry(value):
+    """An expiry date in YYYY-MM-DD form; ValueError if it is not a valid date."""
+    return datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d')
+
+def apply_inventory_form(store, form, actor):
+    """Add, update or delete a medication from a submitted inventory form; ValueError if malformed."""
+    action = form.get("action")
+    if action == "delete":
+        store.delete_medication(form["name"], actor=actor)
+    elif action == "update":
+        changes = dict(parse_pricing_rules(form), price=pricing.parse_price(form["price"]), quantity=parse_quantity(form["quantity"]),
+                       expiry=parse_expiry(form["expiry"]))
+        store.update_medication(form["name"], actor=actor, **changes)
+    else:
+        prescription_required = form.get("prescription_required") == "on"
+        rules = parse_pricing_rules(form)
+        store.add_medication(form["name"], pricing.parse_price(form["price"]), parse_quantity(form["quantity"]), parse_expiry(form["expiry"]), prescription_required, actor=actor, **rules)
+
+def parse_medication_changes(payload):
+    """Turn a PATCH body into update_medication() keywords; TypeError/ValueError if invalid."""
+    changes = parse_pricing_rules(payload)
+    if "price" in payload:
+        changes["price"] = pricing.parse_price(payload["price"])
+    if "quantity" in payload:
+        changes["quantity"] = parse_quantity(payload["quantity"])
+    if "expiry" in payload:
+        changes["expiry"] = parse_expiry(payload["expiry"])
+    return changes
+
+def _sell_line(store, name, qty, prescription_id, actor):
+    """Record one checked sale line; the caller holds the lock and saves the item."""
+    item = store.inventory[name]
+    quote = store.quote(name, qty)
+    store.audit.append(audit_log.SALE, name, actor, item, dict(item, quantity=item["quantity"] - qty))
+    sale = store.record_sale(name, qty, pricing.from_cents(quote.total), prescription_id or generate_prescription_id())
+    item["quantity"] -= qty
+    store.touch(name)
+    store.save_sale(sale)
+    return sale, quote
+
+def sell(store, name, qty, prescription_id, actor):
+    """Sell `qty` units of `name` and return the message shown to the cashier."""
+    with store.lock:
+        inventory = store.inventory
+        if name not in inventory:
+            return None
+        if qty < 1:
+            return "Error: Quantity must be at least 1."
+        if inventory[name]["quantity"] < qty:
+            return f"Error: Insufficient stock for {name}. Available: {inventory[name]['quantity']}"
+        if inventory[name]["prescription_required"] and not prescription_id:
+            return f"Error: {name} requires a prescription ID."
+        sale, quote = _sell_line(store, name, qty, prescription_id, actor)
+        store.save_items(name)
+    adjustments = []
+    if quote.discount:
+        adjustments.append(f"discount ${pricing.from_cents(quote.discount)}")
+    if quote.tax:
+        adjustments.append(f"tax ${pricing.from_cents(quote.tax)}")
+    adjustments = f" ({', '.join(adjustments)})" if adjustments else ""
+    return f"Sold {qty} x {name} for ${sale[2]}{adjustments}. Prescription ID: {sale[3]}"
+
+def parse_cart(payload):
+    """Cart lines [(name, qty, prescription_id)] from a JSON body; TypeError/ValueError if malformed."""
+    items = payload.get("items") if isinstance(payload, dict) else None
+    if not isinstance(items, list) or not items:
+        raise ValueError("items must be a non-empty list")
+    lines = []
+    for line in items:
+        if not isinstance(line, dict) or not isinstance(line.get("name"), str):
+            raise ValueError("every item needs a name")
+        qty = parse_quantity(line.get("quantity", 1), minimum=1)
+        lines.append((line["name"], qty, str(line.get("prescription_id") or "")))
+    return lines
+
+def cart_receipt(priced):
+    """JSON-ready lines and totals for [(line fields, quote)], amounts as decimal strings."""
+    totals = {field: str(pricing.from_cents(sum(getattr(quote, field) for _, quote in priced)))
+              for field in ("subtotal", "discount", "tax", "total")}
+    return dict(totals, lines=[dict(quote.to_dict(), **fields) for fields, quote in priced])
+
+def quote_cart(store, lines):
+    """Price cart lines without selling; KeyError naming the first unknown medication."""
+    with store.lock:
+        priced = []
+        for name, qty, _ in lines:
+            if name not in store.inventory:
+                raise KeyError(name)
+            priced.append(({"name": name}, store.quote(name, qty)))
+    return cart_receipt(priced)
+
+def checkout_cart(store, lines, actor):
+    """Sell every line of a cart or none. Returns (receipt, None) or (None, error message)."""
+    with store.lock:
+        inventory = store.inventory
+        wanted = defaultdict(int)
+        for name, qty, prescription_id in lines:
+            if name not in inventory:
+                return None, f"Unknown medication: {name}"
+            if inventory[name]["prescription_required"] and not prescription_id:
+                return None, f"{name} requires a prescription ID."
+            wanted[name] += qty
+        for name, qty in wanted.items():
+            if inventory[name]["quantity"] < qty:
+                return None, f"Insufficient stock for {name}. Available: {inventory[name]['quantity']}"
+        priced = []
+        for name, qty, prescription_id in lines:
+            sale, quote = _sell_line(store, name, qty, prescription_id, actor)
+            priced.append(({"name": name, "prescription_id": sale[3], "sold_at": sale[4]}, quote))
+        store.save_items(*wanted)
+    return cart_receipt(priced), None
+
+def parse_sync_payload(data, encoding):
+    """Decode a terminal sync body; ValueError or zlib.error if malformed."""
+    return json.loads(decompress_body(data, encoding))
+
+def query_audit(store, args):
+    """Audit entries matching the query-string filters; ValueError if malformed."""
+    since = datetime.fromisoformat(args["since"]) if args.get("since") else None
+    until = datetime.fromisoformat(args["until"]) if args.get("until") else None
+    limit = min(int(args.get("limit", 100)), 10000)
+    return store.audit.query(args.get("medication"), since, until, limit)
+
+def sales_since(store, since):
+    """Sales from log position `since` on, as (rows, since, watermark)."""
+    # Sales are append-only, so a slice of the list is a consistent snapshot
+    # that can be streamed after the lock is released.
+    with store.lock:
+        since = min(since, len(store.sales))
+        rows = store.sales[since:]
+    return rows, since, since + len(rows)
+
+def inventory_items(store):
+    with store.lock:
+        return [(name, dict(item)) for name, item in store.inventory.items()]
+
+def inventory_snapshot(store):
+    with store.lock:
+        items = {name: dict(item) for name, item in store.inventory.items()}
+        return items, store.version, store.etag()
+
+def inventory_context(store):
+    """Page context for templates that list the inventory."""
+    return {"inventory": inventory_snapshot(store)[0]}
+
+def item_snapshot(store, name):
+    with store.lock:
+        item = store.inventory.get(name)
+        return (dict(item) if item is not None else None), store.etag(name)
+
+def sales_snapshot(store):
+    with store.lock:
+        return list(store.sales), store.total_revenue
+
+def edit_item(store, name, method, payload, actor):
+    """Apply an inventory API request.
+
+    Returns None for an unknown medication, otherwise (item, etag) with
+    item None once deleted. Raises TypeError/ValueError for a bad body.
+    """
+    with store.lock:
+        if name not in store.inventory:
+            return None
+        if method == "DELETE":
+            store.delete_medication(name, actor=actor)
+            return None, None
+        if method == "PATCH":
+            store.update_medication(name, actor=actor, **parse_medication_changes(payload))
+        return dict(store.inventory[name]), store.etag(name)
+
+def branch_reports():
+    ensure_stores()
+    with stores_lock:
+        shards = list(stores.values())
+    # Each shard summarises itself under its own lock; the aggregate only
+    # merges the small per-store rollups.
+    rollups = [shard.rollup() for shard in shards]
+    totals = {"num_products": 0, "total_sales": 0, "total_revenue": Decimal("0.00"), "expiring_soon": 0}
+    revenue_by_medication = defaultdict(Decimal)
+    for r in rollups:
+        for key in totals:
+            totals[key] += r[key]
+        for name, revenue in r["revenue_by_medication"].items():
+            revenue_by_medication[name] += revenue
+    revenue_by_medication = sorted(revenue_by_medication.items(), key=lambda item: item[1], reverse=True)
+    return {"rollups": rollups, "totals": totals, "revenue_by_medication": revenue_by_medication}
+
 # -------------------------
 # Templates
 # -------------------------
@@ -68,129 +619,20 @@ base_template = """
 <html>
 <head>
     <title>Pharmacy POS System</title>
-    <link rel="stylesheet" href="https://fonts.googleapis.com/css2?family=Roboto:wght@400;700&display=swap">
-    <style>
-        body {
-            font-family: 'Roboto', sans-serif;
-            background: #0a192f;
-            color: #e6f1ff;
-            margin: 0;
-            padding: 0;
-        }
-        header {
-            background: linear-gradient(to right, #003087, #0052cc);
-            color: white;
-            padding: 1rem;
-            text-align: center;
-            position: sticky;
-            top: 0;
-            z-index: 1000;
-        }
-        nav a {
-            margin: 0 15px;
-            color: white;
-            text-decoration: none;
-            font-weight: bold;
-            transition: color 0.3s ease;
-        }
-        nav a:hover {
-            color: #80bfff;
-        }
-        .container {
-            width: 85%;
-            margin: 2rem auto;
-            background: #172a45;
-            padding: 2rem;
-            border-radius: 12px;
-            box-shadow: 0 4px 12px rgba(0,0,0,0.5);
-        }
-        table {
-            width: 100%;
-            border-collapse: collapse;
-        }
-        th, td {
-            padding: 12px;
-            border-bottom: 1px solid #334874;
-            text-align: left;
-        }
-        th {
-            background: #003087;
-            color: white;
-        }
-        .btn {
-            padding: 8px 16px;
-            margin: 6px 0;
-            background: #0052cc;
-            color: white;
-            border: none;
-            border-radius: 6px;
-            cursor: pointer;
-            transition: all 0.3s ease;
-        }
-        .btn:hover {
-            background: #003087;
-            transform: scale(1.05);
-        }
-        .btn-danger {
-            background: #e63946;
-        }
-        .btn-danger:hover {
-            background: #b32d39;
-            transform: scale(1.05);
-        }
-        .success, .error {
-            font-weight: bold;
-            animation: fadeIn 0.5s ease-in-out;
-        }
-        .success { color: #00cc99; }
-        .error { color: #ff4d4d; }
-        @keyframes fadeIn {
-            from { opacity: 0; }
-            to { opacity: 1; }
-        }
-        .med-grid {
-            display: grid;
-            grid-template-columns: repeat(auto-fill, minmax(250px, 1fr));
-            gap: 1.5rem;
-        }
-        .card {
-            background: #1f4068;
-            padding: 1.5rem;
-            border-radius: 12px;
-            box-shadow: 0 6px 12px rgba(0,0,0,0.3);
-            text-align: center;
-            transition: transform 0.3s ease;
-        }
-        .card:hover {
-            transform: translateY(-5px);
-        }
-        input, select {
-            padding: 8px;
-            margin: 6px 0;
-            background: #2a4b7c;
-            color: #e6f1ff;
-            border: 1px solid #4d6d9a;
-            border-radius: 6px;
-        }
-        @media (max-width: 768px) {
-            .container {
-                width: 95%;
-            }
-            nav a {
-                display: block;
-                margin: 10px 0;
-            }
-        }
-    </style>
+    <link rel="stylesheet" href="{{ asset_url('css/pos.css') }}">
+    <script defer src="{{ asset_url('js/pos.js') }}"></script>
+    {% block scripts %}{% endblock %}
 </head>
 <body>
     <header>
         <h1>Pharmacy POS System</h1>
+        <p>Branch: {{ store or default_store }}</p>
         <nav>
-            <a href="{{ url_for('home') }}">Home</a>
-            <a href="{{ url_for('manage_inventory') }}">Inventory</a>
-            <a href="{{ url_for('sell_medication') }}">Sell Medication</a>
-            <a href="{{ url_for('view_sales') }}">Sales</a>
+            <a href="{{ url_for('home', store=store) }}">Home</a>
+            <a href="{{ url_for('manage_inventory', store=store) }}">Inventory</a>
+            <a href="{{ url_for('sell_medication', store=store) }}">Sell Medication</a>
+            <a href="{{ url_for('view_sales', store=store) }}">Sales</a>
+            <a href="{{ url_for('store_reports') }}">All Branches</a>
         </nav>
     </header>
     <div class="container">
@@ -202,6 +644,9 @@ base_template = """
 
 home_template = """
 {% extends "base.html" %}
+{% block scripts %}
+    {% if labels %}<script defer src="{{ asset_url('js/dashboard.js') }}"></script>{% endif %}
+{% endblock %}
 {% block content %}
     <h2>Welcome to the Pharmacy POS</h2>
     <p>Manage your pharmacy's inventory, sales, and prescriptions efficiently.</p>
@@ -211,89 +656,77 @@ home_template = """
     <p>Total Revenue: ${{ "%.2f"|format(total_revenue) }}</p>
     <p>Medications Expiring Soon (within 30 days): {{ expiring_soon }}</p>
     {% if labels %}
-    <canvas id="myChart" width="600" height="300"></canvas>
-    <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
-    <script>
-    var ctx = document.getElementById('myChart').getContext('2d');
-    var myChart = new Chart(ctx, {
-        type: 'bar',
-        data: {
-            labels: {{ labels | tojson }},
-            datasets: [{
-                label: 'Revenue by Medication',
-                data: {{ data | tojson }},
-                backgroundColor: 'rgba(0, 82, 204, 0.4)',
-                borderColor: 'rgba(0, 82, 204, 1)',
-                borderWidth: 2
-            }]
-        },
-        options: {
-            scales: {
-                y: {
-                    beginAtZero: true,
-                    grid: { color: '#4d6d9a' }
-                },
-                x: {
-                    grid: { color: '#4d6d9a' }
-                }
-            },
-            plugins: {
-                legend: { labels: { color: '#e6f1ff' } }
-            }
-        }
-    });
-    </script>
+    <canvas id="myChart" width="600" height="300" data-labels='{{ labels | tojson }}' data-values='{{ data | tojson }}'></canvas>
     {% endif %}
 {% endblock %}
 """
 
 inventory_template = """
 {% extends "base.html" %}
+{% block scripts %}
+    <script defer src="{{ asset_url('js/inventory.js') }}"></script>
+{% endblock %}
 {% block content %}
     <h2>Medication Inventory</h2>
     <form method="post">
+        <input type="hidden" name="idempotency_key">
         <input type="text" name="name" placeholder="Medication Name" required>
         <input type="number" step="0.01" name="price" placeholder="Price" required>
         <input type="number" name="quantity" placeholder="Quantity" required>
         <input type="date" name="expiry" placeholder="Expiry Date (YYYY-MM-DD)" required>
+        <input type="number" step="0.0001" min="0" max="100" name="tax_rate" placeholder="Tax %">
+        <input type="text" name="discounts" placeholder="Bulk discounts, e.g. 10:5,50:10">
         <label><input type="checkbox" name="prescription_required"> Prescription Required</label>
         <button class="btn" type="submit">Add Medication</button>
     </form>
     <br>
     <div class="med-grid">
         {% for name, data in inventory.items() %}
-        <div class="card">
-            <h3>{{ name }}</h3>
-            <p>Price: ${{ "%.2f"|format(data.price) }}</p>
-            <p>Quantity: {{ data.quantity }}</p>
-            <p>Expiry: {{ data.expiry }}</p>
-            <p>Prescription: {{ 'Required' if data.prescription_required else 'Not Required' }}</p>
-            <form method="post">
-                <input type="hidden" name="action" value="update">
-                <input type="hidden" name="name" value="{{ name }}">
-                <input type="number" step="0.01" name="price" value="{{ "%.2f"|format(data.price) }}" required>
-                <input type="number" name="quantity" value="{{ data.quantity }}" required>
-                <input type="date" name="expiry" value="{{ data.expiry }}" required>
-                <button type="submit" class="btn">Update</button>
-            </form>
-            <form method="post">
-                <input type="hidden" name="action" value="delete">
-                <input type="hidden" name="name" value="{{ name }}">
-                <button type="submit" class="btn btn-danger">Delete</button>
-            </form>
-        </div>
+        {% include "inventory_card.html" %}
         {% endfor %}
     </div>
     <br>
-    <a class="btn" href="{{ url_for('export_inventory') }}">Export Inventory CSV</a>
+    <a class="btn" href="{{ url_for('export_inventory', store=store) }}">Export Inventory CSV</a>
 {% endblock %}
 """
 
+inventory_card_template = """
+<div class="card" data-name="{{ name }}" data-api="{{ url_for('inventory_item_api', store=store, name=name) }}">
+    <h3>{{ name }}</h3>
+    <p>Price: ${{ "%.2f"|format(data.price) }}</p>
+    <p>Quantity: {{ data.quantity }}</p>
+    <p>Expiry: {{ data.expiry }}</p>
+    <p>Prescription: {{ 'Required' if data.prescription_required else 'Not Required' }}</p>
+    <p>Tax: {{ data.tax_rate }}%{% if data.discounts %} &middot; Discounts (qty:%): {{ data.discounts }}{% endif %}</p>
+    <form method="post" action="{{ url_for('manage_inventory', store=store) }}">
+        <input type="hidden" name="idempotency_key">
+        <input type="hidden" name="action" value="update">
+        <input type="hidden" name="name" value="{{ name }}">
+        <input type="number" step="0.01" name="price" value="{{ "%.2f"|format(data.price) }}" required>
+        <input type="number" name="quantity" value="{{ data.quantity }}" required>
+        <input type="date" name="expiry" value="{{ data.expiry }}" required>
+        <input type="number" step="0.0001" min="0" max="100" name="tax_rate" value="{{ data.tax_rate }}" title="Tax %">
+        <input type="text" name="discounts" value="{{ data.discounts }}" placeholder="Bulk discounts, e.g. 10:5,50:10">
+        <button type="submit" class="btn">Update</button>
+    </form>
+    <form method="post" action="{{ url_for('manage_inventory', store=store) }}">
+        <input type="hidden" name="idempotency_key">
+        <input type="hidden" name="action" value="delete">
+        <input type="hidden" name="name" value="{{ name }}">
+        <button type="submit" class="btn btn-danger">Delete</button>
+    </form>
+</div>
+"""
+
 sell_template = """
 {% extends "base.html" %}
+{% block scripts %}
+    <script defer src="{{ asset_url('js/sell.js') }}"></script>
+{% endblock %}
 {% block content %}
     <h2>Sell Medication</h2>
-    <form method="post">
+    <form method="post" data-quote="{{ url_for('cart_quote', store=store) }}">
+        <input type="hidden" name="idempotency_key">
         <select name="name" required>
             {% for name in inventory.keys() %}
             <option value="{{ name }}">{{ name }}</option>
@@ -307,18 +740,6 @@ sell_template = """
     {% if message %}
         <p class="{{ 'success' if 'Sold' in message else 'error' }}">{{ message }}</p>
     {% endif %}
-    <script>
-    var inventory = {{ inventory | tojson }};
-    function updateTotal() {
-        var name = document.querySelector('select[name="name"]').value;
-        var qty = parseInt(document.querySelector('input[name="quantity"]').value) || 1;
-        var total = (inventory[name]?.price || 0) * qty;
-        document.getElementById('total').innerHTML = 'Total: $' + total.toFixed(2);
-    }
-    document.querySelector('select[name="name"]').addEventListener('change', updateTotal);
-    document.querySelector('input[name="quantity"]').addEventListener('input', updateTotal);
-    updateTotal();
-    </script>
 {% endblock %}
 """
 
@@ -340,104 +761,389 @@ sales_template = """
     </table>
     <p>Total Revenue: ${{ "%.2f"|format(total) }}</p>
     <br>
-    <a class="btn" href="{{ url_for('export_sales') }}">Export Sales CSV</a>
+    <a class="btn" href="{{ url_for('export_sales', store=store) }}">Export Sales CSV</a>
+{% endblock %}
+"""
+
+reports_template = """
+{% extends "base.html" %}
+{% block content %}
+    <h2>All Branches</h2>
+    <table>
+        <tr><th>Branch</th><th>Medications</th><th>Sales</th><th>Revenue</th><th>Expiring Soon</th></tr>
+        {% for r in rollups %}
+        <tr>
+            <td><a href="{{ url_for('home', store=r.name) }}">{{ r.name }}</a></td>
+            <td>{{ r.num_products }}</td>
+            <td>{{ r.total_sales }}</td>
+            <td>${{ "%.2f"|format(r.total_revenue) }}</td>
+            <td>{{ r.expiring_soon }}</td>
+        </tr>
+        {% endfor %}
+        <tr>
+            <th>Total</th>
+            <th>{{ totals.num_products }}</th>
+            <th>{{ totals.total_sales }}</th>
+            <th>${{ "%.2f"|format(totals.total_revenue) }}</th>
+            <th>{{ totals.expiring_soon }}</th>
+        </tr>
+    </table>
+    <h3>Revenue by Medication (all branches)</h3>
+    <table>
+        <tr><th>Medication</th><th>Revenue</th></tr>
+        {% for name, revenue in revenue_by_medication %}
+        <tr><td>{{ name }}</td><td>${{ "%.2f"|format(revenue) }}</td></tr>
+        {% endfor %}
+    </table>
+    <h3>Add Branch</h3>
+    <form method="post" action="{{ url_for('add_store') }}">
+        <input type="text" name="name" placeholder="Branch name (a-z, 0-9, -, _)" pattern="[a-z0-9][a-z0-9_-]{0,31}" required>
+        <button class="btn" type="submit">Add Branch</button>
+    </form>
+    {% if message %}
+        <p class="error">{{ message }}</p>
+    {% endif %}
 {% endblock %}
 """
 
 # -------------------------
 # Register templates
 # -------------------------
-app.jinja_loader = DictLoader({
+templates = {
     "base.html": base_template,
     "home.html": home_template,
     "inventory.html": inventory_template,
+    "inventory_card.html": inventory_card_template,
     "sell.html": sell_template,
     "sales.html": sales_template,
-})
+    "reports.html": reports_template,
+}
+app.jinja_loader = DictLoader(templates)
+# At import, so `flask run` and WSGI servers get compiled templates too
+warm_templates()
 
 # -------------------------
 # Routes
 # -------------------------
-@app.route("/")
-def home():
-    sales_summary = defaultdict(float)
-    for s in sales:
-        sales_summary[s[0]] += s[2]
-    labels = list(sales_summary.keys())
-    data = list(sales_summary.values())
-    num_products = len(inventory)
-    total_sales = len(sales)
-    total_revenue = sum(data)
-    expiring_soon = sum(1 for item in inventory.values() if item['expiry'] and (datetime.strptime(item['expiry'], '%Y-%m-%d') - datetime.now()).days <= 30)
-    return render_template("home.html", num_products=num_products, total_sales=total_sales, total_revenue=total_revenue, expiring_soon=expiring_soon, labels=labels, data=data)
-
-@app.route("/inventory", methods=["GET", "POST"])
-def manage_inventory():
-    if request.method == "POST":
-        action = request.form.get("action")
-        if action == "delete":
-            name = request.form["name"]
-            if name in inventory:
-                del inventory[name]
-                save_inventory()
-        elif action == "update":
-            name = request.form["name"]
-            new_price = float(request.form["price"])
-            new_quantity = int(request.form["quantity"])
-            new_expiry = request.form["expiry"]
-            if name in inventory:
-                inventory[name].update({"price": new_price, "quantity": new_quantity, "expiry": new_expiry})
-                save_inventory()
-        else:
-            name = request.form["name"]
-            price = float(request.form["price"])
-            quantity = int(request.form["quantity"])
-            expiry = request.form["expiry"]
-            prescription_required = request.form.get("prescription_required") == "on"
-            inventory[name] = {"price": price, "quantity": quantity, "expiry": expiry, "prescription_required": prescription_required}
-            save_inventory()
-    return render_template("inventory.html", inventory=inventory)
-
-@app.route("/sell", methods=["GET", "POST"])
-def sell_medication():
+# Handlers take a routing.RequestData and return a routing.Reply; the Flask
+# adapter below and the Quart one in pharmacy_pos_async.py register the same
+# table. Handlers block on store locks and files, so the async app runs them
+# in its worker thread pool.
+routes = RouteTable()
+
+@routes.route("/", defaults={"store": None})
+@routes.route("/<store>/")
+def home(req, store):
+    return Page("home.html", dashboard(get_store(store)))
+
+@routes.route("/inventory", methods=["GET", "POST"], defaults={"store": None})
+@routes.route("/<store>/inventory", methods=["GET", "POST"])
+@idempotent
+def manage_inventory(req, store):
+    store = get_store(store)
+    if req.method == "POST":
+        try:
+            apply_inventory_form(store, req.form, req.actor)
+        except ValueError as exc:
+            return Body(f"Error: {exc}", status=400)
+        return Page("inventory.html", {}, refresh=functools.partial(inventory_context, store))
+    items, _, etag = inventory_snapshot(store)
+    return Page("inventory.html", {"inventory": items}, etag=etag)
+
+@routes.route("/inventory/card/<path:name>", defaults={"store": None})
+@routes.route("/<store>/inventory/card/<path:name>")
+def inventory_card(req, store, name):
+    item, etag = item_snapshot(get_store(store), name)
+    if item is None:
+        abort(404)
+    return Page("inventory_card.html", {"name": name, "data": item}, etag=etag)
+
+@routes.route("/api/inventory", defaults={"store": None})
+@routes.route("/<store>/api/inventory")
+def inventory_api(req, store):
+    items, version, etag = inventory_snapshot(get_store(store))
+    return Json({"version": version, "items": items}, etag=etag)
+
+@routes.route("/api/inventory/<path:name>", methods=["GET", "PATCH", "DELETE"], defaults={"store": None})
+@routes.route("/<store>/api/inventory/<path:name>", methods=["GET", "PATCH", "DELETE"])
+@idempotent
+def inventory_item_api(req, store, name):
+    store = get_store(store)
+    payload = (req.json() or {}) if req.method == "PATCH" else None
+    try:
+        result = edit_item(store, name, req.method, payload, req.actor)
+    except (AttributeError, TypeError, ValueError):
+        return Json({"error": "Invalid price, quantity or expiry."}, status=400)
+    if result is None:
+        return Json({"error": f"Unknown medication: {name}"}, status=404)
+    item, etag = result
+    if item is None:
+        return Json({"name": name, "deleted": True})
+    # No store-wide version here: the ETag follows this medication only
+    return Json({"name": name, "item": item},
+                fragments={"html": ("inventory_card.html", {"name": name, "data": item})}, etag=etag)
+
+@routes.route("/sell", methods=["GET", "POST"], defaults={"store": None})
+@routes.route("/<store>/sell", methods=["GET", "POST"])
+@idempotent
+def sell_medication(req, store):
+    store = get_store(store)
     message = None
-    if request.method == "POST":
-        name = request.form["name"]
-        qty = int(request.form["quantity"])
-        prescription_id = request.form.get("prescription_id", "")
-        if name in inventory:
-            if inventory[name]["quantity"] >= qty:
-                if inventory[name]["prescription_required"] and not prescription_id:
-                    message = f"Error: {name} requires a prescription ID."
-                else:
-                    total = inventory[name]["price"] * qty
-                    prescription_id = prescription_id or generate_prescription_id()
-                    sales.append([name, qty, total, prescription_id, datetime.now().strftime('%Y-%m-%d %H:%M:%S')])
-                    inventory[name]["quantity"] -= qty
-                    save_sales()
-                    save_inventory()
-                    message = f"Sold {qty} x {name} for ${total:.2f}. Prescription ID: {prescription_id}"
-            else:
-                message = f"Error: Insufficient stock for {name}. Available: {inventory[name]['quantity']}"
-    return render_template("sell.html", inventory=inventory, message=message)
-
-@app.route("/sales")
-def view_sales():
-    total = sum(s[2] for s in sales)
-    return render_template("sales.html", sales=sales, total=total)
-
-@app.route("/export/inventory")
-def export_inventory():
-    return send_file("inventory.csv", as_attachment=True)
-
-@app.route("/export/sales")
-def export_sales():
-    return send_file("sales.csv", as_attachment=True)
+    if req.method == "POST":
+        message = sell(store, req.form["name"], int(req.form["quantity"]), req.form.get("prescription_id", ""), req.actor)
+    return Page("sell.html", {"message": message}, refresh=functools.partial(inventory_context, store))
+
+@routes.route("/api/cart/quote", methods=["POST"], defaults={"store": None})
+@routes.route("/<store>/api/cart/quote", methods=["POST"])
+def cart_quote(req, store):
+    store = get_store(store)
+    try:
+        return Json(quote_cart(store, parse_cart(req.json())))
+    except (TypeError, ValueError) as exc:
+        return Json({"error": f"Malformed cart: {exc}"}, status=400)
+    except KeyError as exc:
+        return Json({"error": f"Unknown medication: {exc.args[0]}"}, status=404)
+
+@routes.route("/api/cart/checkout", methods=["POST"], defaults={"store": None})
+@routes.route("/<store>/api/cart/checkout", methods=["POST"])
+@idempotent
+def cart_checkout(req, store):
+    store = get_store(store)
+    try:
+        lines = parse_cart(req.json())
+    except (TypeError, ValueError) as exc:
+        return Json({"error": f"Malformed cart: {exc}"}, status=400)
+    receipt, error = checkout_cart(store, lines, req.actor)
+    if error:
+        return Json({"error": error}, status=409)
+    return Json(receipt)
+
+@routes.route("/sales", defaults={"store": None})
+@routes.route("/<store>/sales")
+def view_sales(req, store):
+    sales, total = sales_snapshot(get_store(store))
+    return Page("sales.html", {"sales": sales, "total": total})
+
+@routes.route("/export/inventory", defaults={"store": None})
+@routes.route("/<store>/export/inventory")
+def export_inventory(req, store):
+    store = get_store(store)
+    with store.lock:
+        # Fold pending edits into the file being downloaded
+        if store.journal_entries:
+            store.save_inventory()
+    return csv_download(store.inventory_file)
+
+@routes.route("/export/sales", defaults={"store": None})
+@routes.route("/<store>/export/sales")
+def export_sales(req, store):
+    return csv_download(get_store(store).sales_file)
+
+def csv_download(path):
+    """`path` as an attachment, or an empty CSV if nothing has been written to it yet."""
+    if not os.path.exists(path):
+        return Body("", "text/csv", headers={"Content-Disposition": f"attachment; filename={os.path.basename(path)}"})
+    return File(os.path.abspath(path))
+
+@routes.route("/assets/<digest>/<path:filename>")
+def asset(req, digest, filename):
+    item = assets.get(filename)
+    if item is None:
+        abort(404)
+    data, encoding = item.body(negotiate_encoding(req.accept_encodings))
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    if digest == item.digest:
+        headers["Cache-Control"] = f"public, max-age={ASSET_MAX_AGE}, immutable"
+    else:
+        # Stale fingerprint from an old page: serve the current file but let
+        # the browser revalidate, since the content no longer matches the URL.
+        headers["Cache-Control"] = "no-cache"
+    return Body(data, item.mimetype, headers=headers, etag=f"{item.digest}-{encoding or 'identity'}", weak_etag=False)
+
+def read_sync_payload(req):
+    try:
+        payload = parse_sync_payload(req.body, req.headers.get("Content-Encoding"))
+    except (ValueError, zlib.error):
+        abort(400)
+    if not isinstance(payload, dict):
+        abort(400)
+    return payload
+
+@routes.route("/api/terminals/<terminal_id>/allocation", methods=["POST"], defaults={"store": None})
+@routes.route("/<store>/api/terminals/<terminal_id>/allocation", methods=["POST"])
+def terminal_allocation(req, store, terminal_id):
+    store = get_store(store)
+    payload = read_sync_payload(req)
+    try:
+        allocation, granted, catalog = store.terminals.allocate(store, terminal_id, payload.get("target"))
+    except (TypeError, ValueError):
+        return Json({"error": "Malformed allocation request."}, status=400)
+    return Json({"allocation": allocation, "granted": granted, "catalog": catalog})
+
+@routes.route("/api/terminals/<terminal_id>/sales", methods=["POST"], defaults={"store": None})
+@routes.route("/<store>/api/terminals/<terminal_id>/sales", methods=["POST"])
+def terminal_sales(req, store, terminal_id):
+    store = get_store(store)
+    payload = read_sync_payload(req)
+    try:
+        return Json(store.terminals.apply_sales(store, terminal_id, payload.get("sales", [])))
+    except (TypeError, ValueError):
+        return Json({"error": "Malformed sales batch."}, status=400)
+
+@routes.route("/api/audit", defaults={"store": None})
+@routes.route("/<store>/api/audit")
+def audit_api(req, store):
+    try:
+        entries = query_audit(get_store(store), req.args)
+    except ValueError:
+        return Json({"error": "since/until must be ISO dates and limit an integer."}, status=400)
+    return Json({"entries": entries})
+
+def columnar_format(req):
+    fmt = req.args.get("format", columnar_export.formats()[0])
+    if fmt not in columnar_export.formats():
+        abort(400, f"Unsupported format '{fmt}'. Available: {', '.join(columnar_export.formats())}")
+    return fmt
+
+@routes.route("/export/sales/columnar", defaults={"store": None})
+@routes.route("/<store>/export/sales/columnar")
+def export_sales_columnar(req, store):
+    store = get_store(store)
+    fmt = columnar_format(req)
+    try:
+        since = max(int(req.args.get("since", 0)), 0)
+    except ValueError:
+        abort(400, "since must be an integer watermark")
+    rows, since, watermark = sales_since(store, since)
+    chunks = columnar_export.stream(columnar_export.SALES_COLUMNS, columnar_export.sales_batches(rows, since), fmt)
+    return Stream(chunks, columnar_export.mimetype(fmt), headers={
+        "X-Export-Watermark": str(watermark),
+        "Content-Disposition": f"attachment; filename=sales-{store.name}-{since}-{watermark}.{fmt}",
+    })
+
+@routes.route("/export/inventory/columnar", defaults={"store": None})
+@routes.route("/<store>/export/inventory/columnar")
+def export_inventory_columnar(req, store):
+    store = get_store(store)
+    fmt = columnar_format(req)
+    chunks = columnar_export.stream(columnar_export.INVENTORY_COLUMNS, columnar_export.inventory_batches(inventory_items(store)), fmt)
+    return Stream(chunks, columnar_export.mimetype(fmt), headers={
+        "Content-Disposition": f"attachment; filename=inventory-{store.name}.{fmt}",
+    })
+
+@routes.route("/reports")
+def store_reports(req, message=None):
+    return Page("reports.html", dict(branch_reports(), message=message))
+
+@routes.route("/stores", methods=["POST"])
+def add_store(req):
+    name = req.form["name"].strip().lower()
+    if create_store(name) is None:
+        return store_reports(req, message=f"Error: invalid branch name '{name}'.")
+    return Redirect("manage_inventory", {"store": name})
+
+# -------------------------
+# Flask app
+# -------------------------
+def read_request():
+    # get_data() first: it caches the body, which form parsing then reuses
+    body = request.get_data()
+    return RequestData(request.method, request.path, request.args, request.form, request.headers,
+                       body, request.remote_addr, request.accept_encodings)
+
+def to_response(reply):
+    """Turn a handler's Reply into a Flask response."""
+    if isinstance(reply, Page):
+        response = app.make_response(render_template(reply.template, **reply.context))
+    elif isinstance(reply, Json):
+        fragments = {key: render_template(template, **context) for key, (template, context) in reply.fragments.items()}
+        response = jsonify(dict(reply.data, **fragments))
+    elif isinstance(reply, Body):
+        response = app.response_class(reply.data, mimetype=reply.mimetype)
+    elif isinstance(reply, Stream):
+        response = app.response_class(reply.chunks, mimetype=reply.mimetype)
+    elif isinstance(reply, File):
+        response = send_file(reply.path, as_attachment=True)
+    else:
+        response = redirect(url_for(reply.endpoint, **reply.values))
+    response.status_code = reply.status
+    response.headers.update(reply.headers)
+    if reply.etag:
+        response.set_etag(reply.etag, weak=reply.weak_etag)
+        response = response.make_conditional(request)
+    return response
+
+def flask_view(handler):
+    @functools.wraps(handler)
+    def view(**kwargs):
+        return to_response(handler(read_request(), **kwargs))
+    return view
+
+@app.after_request
+def compress_response(response):
+    if (response.direct_passthrough or response.is_streamed or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES or response.status_code in (204, 304)):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = negotiate_encoding(request.accept_encodings)
+    data = response.get_data()
+    if encoding is None or len(data) < MIN_COMPRESS_SIZE:
+        return response
+    response.set_data(compress(data, encoding))
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+@app.context_processor
+def inject_store():
+    # Store-scoped routes carry the branch in the URL; templates pass it back
+    # to url_for so navigation stays inside the same branch.
+    return {"store": (request.view_args or {}).get("store"), "default_store": DEFAULT_STORE}
+
+routes.register(app, flask_view)
 
 # -------------------------
 # Startup
 # -------------------------
+def start_terminal_mode(terminal_id, central_url, allocation_target, interval):
+    """Run the default store as an offline terminal of a central instance."""
+    store = get_store(DEFAULT_STORE)
+    with store.lock:
+        store.sale_queue = SaleQueue(os.path.join(data_dir, "sale_queue.csv"))
+        store.sale_queue.load()
+        store.load_sales()
+    sync = TerminalSync(store, store.sale_queue, central_url, terminal_id, allocation_target, interval)
+    sync.start()
+    return sync
+
+def arg_parser(description="Pharmacy POS"):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--data-dir", help="directory holding the CSV files (default: current directory)")
+    parser.add_argument("--terminal", metavar="ID", help="run as an offline terminal with this ID")
+    parser.add_argument("--central", metavar="URL", help="central instance URL, optionally with a /<branch> prefix")
+    parser.add_argument("--allocation", type=int, default=20, help="units of each medication a terminal keeps on hand")
+    parser.add_argument("--sync-interval", type=float, default=10, help="seconds between terminal sync attempts")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--debug", action="store_true", help="enable the debugger and auto-reload (development only)")
+    return parser
+
+def configure(parser, args):
+    """Apply the command-line options shared by both servers and load the stores."""
+    global data_dir
+    if args.terminal and not args.central:
+        parser.error("--terminal requires --central")
+    if args.data_dir:
+        os.makedirs(args.data_dir, exist_ok=True)
+        data_dir = args.data_dir
+    load_stores()
+    if args.terminal:
+        start_terminal_mode(args.terminal, args.central, args.allocation, args.sync_interval)
+
 if __name__ == "__main__":
-    load_inventory()
-    load_sales()
-    app.run(debug=True)
\ No newline at end of file
+    parser = arg_parser()
+    args = parser.parse_args()
+    configure(parser, args)
+    # The reloader would start a second terminal sync thread
+    app.run(host=args.host, port=args.port, debug=args.debug, use_reloader=args.debug and not args.terminal)
@@ -0,0 +1,132 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from hypercorn.asyncio import serve
+from hypercorn.config import Config
+from jinja2 import DictLoader
+from quart import Quart, jsonify, redirect, render_template, request, send_file, url_for
+from quart.utils import run_sync, run_sync_iterable
+from quart.wrappers.response import DataBody
+
+import pharmacy_pos as pos
+from assets import COMPRESSIBLE_TYPES, MIN_COMPRESS_SIZE, compress, negotiate_encoding
+from routing import Body, File, Json, Page, RequestData, Stream
+
+# -------------------------
+# Async serving mode
+# -------------------------
+# The same routes and templates as pharmacy_pos.py, served by an ASGI server
+# (hypercorn). The event loop only parses requests and renders templates.
+# The route handlers, which take store locks and touch the disk, run in a
+# thread pool, so a slow write holds up one worker thread instead of the
+# whole process.
+#
+#     pip install quart hypercorn
+#     python pharmacy_pos_async.py --port 8000
+
+app = Quart(__name__, static_folder=None)
+app.jinja_loader = DictLoader(pos.templates)
+
+# Worker threads for blocking store and file I/O. Sales in one store still
+# run one at a time under its lock; the pool lets other stores, page renders
+# and slow disks proceed meanwhile.
+IO_THREADS = 32
+# Larger response bodies are compressed in the pool, not on the event loop
+INLINE_COMPRESS_LIMIT = 64 * 1024
+
+
+def blocking(func, *args, **kwargs):
+    """Run a blocking call (store lock, file I/O) in the worker thread pool."""
+    return run_sync(func)(*args, **kwargs)
+
+
+# -------------------------
+# Adapter
+# -------------------------
+# The routes are the shared handlers of pharmacy_pos.routes. Each one runs
+# in the pool as a whole, since it may take a store lock or touch the disk;
+# the loop only reads the request and renders the reply's template.
+async def read_request():
+    body = await request.get_data()
+    return RequestData(request.method, request.path, request.args, await request.form, request.headers,
+                       body, request.remote_addr, request.accept_encodings)
+
+async def to_response(reply):
+    """Turn a handler's Reply into a Quart response."""
+    if isinstance(reply, Page):
+        response = await app.make_response(await render_template(reply.template, **reply.context))
+    elif isinstance(reply, Json):
+        fragments = {key: await render_template(template, **context) for key, (template, context) in reply.fragments.items()}
+        response = jsonify(dict(reply.data, **fragments))
+    elif isinstance(reply, Body):
+        response = app.response_class(reply.data, mimetype=reply.mimetype)
+    elif isinstance(reply, Stream):
+        # Each chunk is produced in the pool while earlier ones are being sent
+        response = app.response_class(run_sync_iterable(reply.chunks), mimetype=reply.mimetype)
+    elif isinstance(reply, File):
+        response = await send_file(reply.path, as_attachment=True)
+    else:
+        response = redirect(url_for(reply.endpoint, **reply.values))
+    response.status_code = reply.status
+    response.headers.update(reply.headers)
+    if reply.etag:
+        response.set_etag(reply.etag, weak=reply.weak_etag)
+        response = await response.make_conditional(request)
+    return response
+
+def async_view(handler):
+    @functools.wraps(handler)
+    async def view(**kwargs):
+        reply = await blocking(handler, await read_request(), **kwargs)
+        return await to_response(reply)
+    return view
+
+@app.template_global()
+def asset_url(path):
+    return url_for("asset", digest=pos.assets.get(path).digest, filename=path)
+
+@app.context_processor
+def inject_store():
+    return {"store": (request.view_args or {}).get("store"), "default_store": pos.DEFAULT_STORE}
+
+@app.after_request
+async def compress_response(response):
+    # Only in-memory bodies; files and streams are sent as they are
+    if (not isinstance(response.response, DataBody) or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES or response.status_code in (204, 304)):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = negotiate_encoding(request.accept_encodings)
+    data = await response.get_data()
+    if encoding is None or len(data) < MIN_COMPRESS_SIZE:
+        return response
+    if len(data) > INLINE_COMPRESS_LIMIT:
+        response.set_data(await blocking(compress, data, encoding))
+    else:
+        response.set_data(compress(data, encoding))
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+pos.routes.register(app, async_view)
+
+# -------------------------
+# Startup
+# -------------------------
+@app.before_serving
+async def startup():
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(IO_THREADS, thread_name_prefix="pos-io"))
+    # Already loaded when started through __main__; `hypercorn
+    # pharmacy_pos_async:app` serves the current directory
+    await blocking(pos.ensure_stores)
+    pos.warm_templates(app.jinja_env)
+
+if __name__ == "__main__":
+    parser = pos.arg_parser("Pharmacy POS (async)")
+    args = parser.parse_args()
+    pos.configure(parser, args)
+    app.debug = args.debug
+    config = Config()
+    config.bind = [f"{args.host}:{args.port}"]
+    config.accesslog = "-" if args.debug else None
+    asyncio.run(serve(app, config))
@@ -0,0 +1,174 @@
+from bisect import bisect_right
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+# -------------------------
+# Pricing
+# -------------------------
+# Exact checkout arithmetic. Money is handled in integer cents and rates in
+# parts per million, so no total ever picks up float rounding error.
+#
+# Each medication may carry two pricing rules next to its price:
+#   tax_rate    percent added on top of the discounted amount, e.g. 8.25
+#   discounts   quantity tiers as "min_qty:percent_off,...", e.g. "10:5,50:12.5"
+#               (the highest tier the quantity reaches applies)
+#
+# A line is priced as
+#   subtotal = unit price * quantity
+#   discount = subtotal * tier percent, rounded half up to the cent
+#   tax      = (subtotal - discount) * tax rate, rounded half up to the cent
+#   total    = subtotal - discount + tax
+#
+# Parsing a medication's rules into a PriceSchedule is the slow part, so
+# schedules are memoized per medication and dropped when its price or rules
+# change.
+
+CENT = Decimal("0.01")
+PPM = 1_000_000
+# Line quotes are cached per schedule for quantities up to this
+MAX_MEMO_QUANTITY = 100
+
+
+def money(value):
+    """`value` (str, int, float or Decimal) as a Decimal rounded half up to the cent."""
+    try:
+        amount = Decimal(str(value)).quantize(CENT, ROUND_HALF_UP)
+    except InvalidOperation:
+        raise ValueError(f"invalid amount: {value!r}") from None
+    if not amount.is_finite():
+        raise ValueError(f"invalid amount: {value!r}")
+    return amount
+
+
+def parse_price(value):
+    """A unit price as a Decimal rounded to the cent; ValueError if not a finite, non-negative amount."""
+    price = money(value)
+    if price < 0:
+        raise ValueError(f"price must not be negative: {value!r}")
+    return price
+
+
+def to_cents(value):
+    return int(money(value) * 100)
+
+
+def from_cents(cents):
+    return Decimal(cents).scaleb(-2).quantize(CENT)
+
+
+def parse_rate(value):
+    """A percentage such as "8.25" as parts per million; ValueError unless 0-100."""
+    try:
+        rate = Decimal(str(value))
+        ppm = rate * PPM / 100
+    except InvalidOperation:
+        raise ValueError(f"invalid percentage: {value!r}") from None
+    if not rate.is_finite() or not 0 <= rate <= 100 or ppm != ppm.to_integral_value():
+        raise ValueError(f"percentage must be 0-100 with at most 4 decimals: {value!r}")
+    return int(ppm)
+
+
+def parse_percent(value):
+    """A percentage validated by parse_rate(), as an exact Decimal such as Decimal("8.25")."""
+    return Decimal(parse_rate(value)) / (PPM // 100)
+
+
+def parse_discounts(text):
+    """Parse "10:5,50:12.5" into [(min_qty, ppm)] sorted by quantity; ValueError if malformed."""
+    tiers = {}
+    for part in (text or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        quantity, sep, percent = part.partition(":")
+        if not sep:
+            raise ValueError(f"discount tier must be min_qty:percent: {part!r}")
+        quantity = int(quantity)
+        if quantity < 1:
+            raise ValueError(f"discount tier quantity must be positive: {part!r}")
+        tiers[quantity] = parse_rate(percent.strip())
+    return sorted(tiers.items())
+
+
+def normalize_discounts(text):
+    """Validate discount tiers and return them in canonical "qty:percent" form."""
+    return ",".join(f"{quantity}:{(Decimal(ppm) / (PPM // 100)).normalize():f}" for quantity, ppm in parse_discounts(text))
+
+
+def _percent_of(cents, ppm):
+    # Round half up; amounts are never negative
+    return (cents * ppm + PPM // 2) // PPM
+
+
+class Quote:
+    """Price of one cart line, in cents."""
+    __slots__ = ("quantity", "unit_price", "subtotal", "discount", "tax", "total")
+
+    def __init__(self, quantity, unit_price, subtotal, discount, tax, total):
+        self.quantity = quantity
+        self.unit_price = unit_price
+        self.subtotal = subtotal
+        self.discount = discount
+        self.tax = tax
+        self.total = total
+
+    def to_dict(self):
+        # Amounts as decimal strings, so JSON clients never see a float
+        return {
+            "quantity": self.quantity,
+            "unit_price": str(from_cents(self.unit_price)),
+            "subtotal": str(from_cents(self.subtotal)),
+            "discount": str(from_cents(self.discount)),
+            "tax": str(from_cents(self.tax)),
+            "total": str(from_cents(self.total)),
+        }
+
+
+class PriceSchedule:
+    """One medication's price and rules, parsed once into integer form."""
+
+    def __init__(self, price, tax_rate=0, discounts=""):
+        self.unit_price = to_cents(price)
+        self.tax_ppm = parse_rate(tax_rate)
+        tiers = parse_discounts(discounts)
+        self.tier_quantities = [quantity for quantity, _ in tiers]
+        self.tier_ppms = [ppm for _, ppm in tiers]
+        self._quotes = {}
+
+    def quote(self, quantity):
+        quote = self._quotes.get(quantity)
+        if quote is not None:
+            return quote
+        subtotal = self.unit_price * quantity
+        tier = bisect_right(self.tier_quantities, quantity)
+        discount = _percent_of(subtotal, self.tier_ppms[tier - 1]) if tier else 0
+        tax = _percent_of(subtotal - discount, self.tax_ppm)
+        quote = Quote(quantity, self.unit_price, subtotal, discount, tax, subtotal - discount + tax)
+        if quantity <= MAX_MEMO_QUANTITY:
+            self._quotes[quantity] = quote
+        return quote
+
+
+class PriceCache:
+    """Memoized PriceSchedule per medication name.
+
+    The owner must call invalidate() whenever a medication's price, tax rate
+    or discounts change, and clear() when the inventory is reloaded.
+    """
+
+    def __init__(self):
+        self.schedules = {}
+
+    def schedule(self, name, item):
+        schedule = self.schedules.get(name)
+        if schedule is None:
+            schedule = self.schedules[name] = PriceSchedule(item["price"], item.get("tax_rate", 0), item.get("discounts", ""))
+        return schedule
+
+    def quote(self, name, item, quantity):
+        return self.schedule(name, item).quote(quantity)
+
+    def invalidate(self, name):
+        self.schedules.pop(name, None)
+
+    def clear(self):
+        self.schedules.clear()
@@ -0,0 +1,151 @@
+import copy
+import json
+
+# -------------------------
+# Framework-neutral routes
+# -------------------------
+# Every route is written once, as a plain function of a RequestData and the
+# URL variables that returns a Reply. pharmacy_pos.py registers the routes
+# with Flask and pharmacy_pos_async.py with Quart. Each app has a small
+# adapter that reads the request up front and turns the Reply into its own
+# Response, so the two servers cannot drift apart.
+
+
+class RequestData:
+    """The parts of a request a handler may use, read before the handler runs."""
+    __slots__ = ("method", "path", "args", "form", "headers", "body", "actor", "accept_encodings")
+
+    def __init__(self, method, path, args, form, headers, body, actor, accept_encodings):
+        self.method = method
+        self.path = path
+        self.args = args
+        self.form = form
+        self.headers = headers
+        self.body = body
+        # Who is making the request, as recorded in the audit log
+        self.actor = actor
+        self.accept_encodings = accept_encodings
+
+    def json(self):
+        """The body parsed as JSON, or None if it is not valid JSON."""
+        try:
+            return json.loads(self.body)
+        except ValueError:
+            return None
+
+
+class Reply:
+    """Base of all handler results.
+
+    A reply with an `etag` answers a GET with 304 Not Modified when the
+    client's If-None-Match matches it.
+    """
+    # Streamed replies are sent as they are produced and never cached
+    streamed = False
+
+    def __init__(self, status=200, headers=None, etag=None, weak_etag=True):
+        self.status = status
+        self.headers = dict(headers or {})
+        self.etag = etag
+        self.weak_etag = weak_etag
+
+    def remembered(self):
+        """The reply as kept for replaying an idempotent request later."""
+        return self
+
+    def replayed(self):
+        """A copy marked as a replay of an earlier idempotent request."""
+        reply = copy.copy(self)
+        reply.headers = dict(self.headers, **{"Idempotent-Replayed": "true"})
+        return reply
+
+
+class Page(Reply):
+    """A rendered template. `context` must be a snapshot, not live store data.
+
+    Snapshots of store data can come from `refresh()` instead, which returns
+    more context. A remembered page keeps only `context` and calls refresh()
+    again when it is replayed, so the idempotency cache never holds a copy
+    of the inventory.
+    """
+
+    def __init__(self, template, context, refresh=None, **options):
+        super().__init__(**options)
+        self.template = template
+        self.base_context = context
+        self.refresh = refresh
+        self.context = dict(context, **refresh()) if refresh else context
+
+    def remembered(self):
+        reply = copy.copy(self)
+        reply.context = self.base_context
+        return reply
+
+    def replayed(self):
+        reply = super().replayed()
+        if self.refresh:
+            reply.context = dict(self.base_context, **self.refresh())
+        return reply
+
+
+class Json(Reply):
+    """A JSON document. Each `fragments` entry {key: (template, context)} is rendered into data[key]."""
+
+    def __init__(self, data, fragments=None, **options):
+        super().__init__(**options)
+        self.data = data
+        self.fragments = fragments or {}
+
+
+class Body(Reply):
+    def __init__(self, data, mimetype="text/html", **options):
+        super().__init__(**options)
+        self.data = data
+        self.mimetype = mimetype
+
+
+class Stream(Reply):
+    """A body produced chunk by chunk by a (blocking) iterable."""
+    streamed = True
+
+    def __init__(self, chunks, mimetype, **options):
+        super().__init__(**options)
+        self.chunks = chunks
+        self.mimetype = mimetype
+
+
+class File(Reply):
+    """A file on disk, sent as an attachment."""
+    streamed = True
+
+    def __init__(self, path, **options):
+        super().__init__(**options)
+        self.path = path
+
+
+class Redirect(Reply):
+    def __init__(self, endpoint, values, status=302, **options):
+        super().__init__(status=status, **options)
+        self.endpoint = endpoint
+        self.values = values
+
+
+class RouteTable:
+    """URL rules and their handlers, registered later with a Flask or Quart app."""
+
+    def __init__(self):
+        self.rules = []
+
+    def route(self, rule, **options):
+        def decorator(handler):
+            self.rules.append((rule, handler.__name__, handler, options))
+            return handler
+        return decorator
+
+    def register(self, app, make_view):
+        """Add every rule to `app`; make_view(handler) builds the app's view function."""
+        views = {}
+        for rule, endpoint, handler, options in self.rules:
+            if endpoint not in views:
+                views[endpoint] = make_view(handler)
+            app.add_url_rule(rule, endpoint, views[endpoint], **options)
@@ -0,0 +1,50 @@
+// Revenue-by-medication bar chart drawn straight onto the canvas, so the
+// dashboard works on terminals without access to a charting CDN.
+(function () {
+    var canvas = document.getElementById('myChart');
+    if (!canvas) {
+        return;
+    }
+    var labels = JSON.parse(canvas.dataset.labels);
+    var data = JSON.parse(canvas.dataset.values);
+    var ctx = canvas.getContext('2d');
+    var width = canvas.width, height = canvas.height;
+    var left = 60, right = 10, top = 30, bottom = 40;
+    var plotWidth = width - left - right, plotHeight = height - top - bottom;
+    var max = Math.max.apply(null, data.concat([0])) || 1;
+    var steps = 5;
+
+    ctx.font = '12px sans-serif';
+    ctx.fillStyle = 'rgba(0, 82, 204, 0.4)';
+    ctx.fillRect(left, 8, 30, 12);
+    ctx.fillStyle = '#e6f1ff';
+    ctx.fillText('Revenue by Medication', left + 38, 18);
+
+    ctx.strokeStyle = '#4d6d9a';
+    ctx.lineWidth = 1;
+    ctx.textAlign = 'right';
+    for (var i = 0; i <= steps; i++) {
+        var y = top + plotHeight - plotHeight * i / steps;
+        ctx.beginPath();
+        ctx.moveTo(left, y);
+        ctx.lineTo(width - right, y);
+        ctx.stroke();
+        ctx.fillText((max * i / steps).toFixed(2), left - 6, y + 4);
+    }
+
+    var slot = plotWidth / Math.max(data.length, 1);
+    var barWidth = slot * 0.6;
+    ctx.textAlign = 'center';
+    ctx.lineWidth = 2;
+    data.forEach(function (value, index) {
+        var x = left + slot * index + (slot - barWidth) / 2;
+        var barHeight = plotHeight * value / max;
+        var y = top + plotHeight - barHeight;
+        ctx.fillStyle = 'rgba(0, 82, 204, 0.4)';
+        ctx.fillRect(x, y, barWidth, barHeight);
+        ctx.strokeStyle = 'rgba(0, 82, 204, 1)';
+        ctx.strokeRect(x, y, barWidth, barHeight);
+        ctx.fillStyle = '#e6f1ff';
+        ctx.fillText(labels[index], x + barWidth / 2, top + plotHeight + 16, slot);
+    });
+})();
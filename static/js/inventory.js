@@ -0,0 +1,44 @@
+// Send card edits to the JSON API and swap in the returned card, so editing
+// one medication does not re-render the whole inventory grid. Without
+// JavaScript the forms still post to /inventory as before.
+document.querySelector('.med-grid').addEventListener('submit', function (event) {
+    var form = event.target;
+    var card = form.closest('.card');
+    var action = form.elements.action.value;
+    var request = {
+        method: action === 'delete' ? 'DELETE' : 'PATCH',
+        headers: {'Idempotency-Key': form.elements.idempotency_key.value, 'Content-Type': 'application/json'}
+    };
+    if (action === 'update') {
+        request.body = JSON.stringify({
+            price: form.elements.price.value,
+            quantity: form.elements.quantity.value,
+            expiry: form.elements.expiry.value,
+            tax_rate: form.elements.tax_rate.value,
+            discounts: form.elements.discounts.value
+        });
+    }
+    event.preventDefault();
+    fetch(card.dataset.api, request).then(function (response) {
+        return response.json().then(function (result) {
+            if (!response.ok) {
+                throw new Error(result.error || response.statusText);
+            }
+            return result;
+        });
+    }).then(function (result) {
+        if (result.deleted) {
+            card.remove();
+            return;
+        }
+        var template = document.createElement('template');
+        template.innerHTML = result.html.trim();
+        var fresh = template.content.firstElementChild;
+        fillIdempotencyKeys(fresh);
+        card.replaceWith(fresh);
+    }).catch(function (error) {
+        // The edit was not applied; a corrected resubmit is a new request
+        form.elements.idempotency_key.value = newIdempotencyKey();
+        alert('Could not save ' + card.dataset.name + ': ' + error.message);
+    });
+});
@@ -0,0 +1,16 @@
+// Give every form a fresh idempotency key on page load. Clicking submit
+// again after a network hiccup resends the same key, so the server replays
+// the first result instead of recording the sale twice.
+function newIdempotencyKey() {
+    var bytes = new Uint8Array(16);
+    crypto.getRandomValues(bytes);
+    return Array.from(bytes, function (b) { return ('0' + b.toString(16)).slice(-2); }).join('');
+}
+
+function fillIdempotencyKeys(root) {
+    root.querySelectorAll('input[name="idempotency_key"]').forEach(function (input) {
+        input.value = newIdempotencyKey();
+    });
+}
+
+fillIdempotencyKeys(document);
@@ -0,0 +1,37 @@
+// The running total comes from the cart quote API, so the page shows the
+// same exact price, discount and tax the server charges at checkout.
+var sellForm = document.querySelector('form[data-quote]');
+var pendingQuote = 0;
+function updateTotal() {
+    var name = sellForm.elements.name.value;
+    var qty = parseInt(sellForm.elements.quantity.value) || 1;
+    var output = document.getElementById('total');
+    if (!name || qty < 1) {
+        output.textContent = 'Total: $0.00';
+        return;
+    }
+    var request = ++pendingQuote;
+    fetch(sellForm.dataset.quote, {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({items: [{name: name, quantity: qty}]})
+    }).then(function (response) {
+        return response.ok ? response.json() : null;
+    }).then(function (quote) {
+        // Ignore answers to requests that a later keystroke superseded
+        if (request !== pendingQuote || !quote) {
+            return;
+        }
+        var adjustments = [];
+        if (quote.discount !== '0.00') {
+            adjustments.push('discount $' + quote.discount);
+        }
+        if (quote.tax !== '0.00') {
+            adjustments.push('tax $' + quote.tax);
+        }
+        output.textContent = 'Total: $' + quote.total + (adjustments.length ? ' (' + adjustments.join(', ') + ')' : '');
+    }).catch(function () {});
+}
+sellForm.elements.name.addEventListener('change', updateTotal);
+sellForm.elements.quantity.addEventListener('input', updateTotal);
+updateTotal();
@@ -0,0 +1,379 @@
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+import threading
+import urllib.error
+import urllib.request
+import uuid
+import zlib
+from collections import defaultdict
+from datetime import datetime
+
+import audit_log
+import pricing
+
+# -------------------------
+# Offline terminal mode
+# -------------------------
+# A terminal runs its own copy of the app. Sales go to a local durable queue
+# and are sold against stock the central instance has allocated to the
+# terminal. A background thread pushes queued sales to the central instance
+# in gzip-compressed batches and tops up the allocation when it can reach it.
+
+log = logging.getLogger(__name__)
+
+SYNC_BATCH_SIZE = 500
+SALE_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+MAX_SYNC_BODY = 16 * 1024 * 1024
+
+
+def decompress_body(data, encoding):
+    """Decode a request body sent with Content-Encoding gzip (size-limited)."""
+    if encoding != "gzip":
+        return data
+    decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    body = decoder.decompress(data, MAX_SYNC_BODY)
+    if decoder.unconsumed_tail:
+        raise ValueError("sync batch too large")
+    return body
+
+
+def _sale_time(timestamp):
+    """A sale timestamp in the sales.csv format; ValueError if it is not one."""
+    return datetime.strptime(str(timestamp), SALE_TIME_FORMAT).strftime(SALE_TIME_FORMAT)
+
+
+def _queue_row(row):
+    """A sale queue row parsed from CSV; ValueError if it is incomplete."""
+    if len(row) != 6:
+        raise ValueError(f"incomplete sale queue row: {row!r}")
+    return [row[0], row[1], int(row[2]), pricing.money(row[3]), row[4], row[5]]
+
+
+def _fsync_dir(path):
+    if hasattr(os, "O_DIRECTORY"):
+        fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+class SaleQueue:
+    """Append-only CSV of a terminal's sales plus a cursor of how many are synced.
+
+    Each row is [sale_id, name, qty, total, prescription_id, timestamp]. Rows
+    are fsynced as they are appended, so a sale survives a crash or power cut
+    before it reaches the central instance.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.cursor_path = path + ".cursor"
+        self.rows = []
+        self.cursor = 0
+        self.lock = threading.Lock()
+
+    def load(self):
+        self.rows = []
+        if os.path.exists(self.path):
+            with open(self.path, mode="rb") as f:
+                data = f.read()
+            # Only the last row can be cut short by a crash: a row missing its
+            # newline or some of its fields was never fully written, so it is
+            # dropped and later appends start on a line of their own
+            end = data.rfind(b"\n") + 1
+            rows = [row for row in csv.reader(io.StringIO(data[:end].decode("utf-8"), newline="")) if row]
+            if rows:
+                try:
+                    _queue_row(rows[-1])
+                except ValueError:
+                    rows.pop()
+                    end = data.rfind(b"\n", 0, end - 1) + 1
+            if end < len(data):
+                os.truncate(self.path, end)
+            self.rows = [_queue_row(row) for row in rows]
+        self.cursor = 0
+        if os.path.exists(self.cursor_path):
+            with open(self.cursor_path) as f:
+                self.cursor = min(int(f.read().strip() or 0), len(self.rows))
+
+    def sales(self):
+        return [row[1:] for row in self.rows]
+
+    def append(self, sale):
+        row = [uuid.uuid4().hex] + list(sale)
+        with self.lock:
+            with open(self.path, mode="a", newline="") as f:
+                csv.writer(f).writerow(row)
+                f.flush()
+                os.fsync(f.fileno())
+            self.rows.append(row)
+        return row
+
+    def pending(self, limit=SYNC_BATCH_SIZE):
+        with self.lock:
+            return self.rows[self.cursor:self.cursor + limit]
+
+    def pending_count(self):
+        with self.lock:
+            return len(self.rows) - self.cursor
+
+    def pending_quantities(self):
+        """Units of each medication sold in sales not yet synced."""
+        quantities = defaultdict(int)
+        with self.lock:
+            for row in self.rows[self.cursor:]:
+                quantities[row[1]] += row[2]
+        return quantities
+
+    def mark_synced(self, count):
+        with self.lock:
+            self.cursor = min(self.cursor + count, len(self.rows))
+            tmp_path = self.cursor_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                f.write(str(self.cursor))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.cursor_path)
+            _fsync_dir(self.cursor_path)
+
+
+class TerminalLedger:
+    """Central-side record of stock allocated to terminals and sales already synced.
+
+    A synced sale's ID is stored as an extra last column of its sales.csv
+    row, so the sale and the record that it was synced are one write.
+    """
+
+    def __init__(self, data_dir):
+        self.allocations_file = os.path.join(data_dir, "allocations.csv")
+        self.sales_file = os.path.join(data_dir, "sales.csv")
+        # Sale IDs synced before they were kept in sales.csv
+        self.synced_file = os.path.join(data_dir, "synced_sales.csv")
+        self.allocations = {}
+        self.synced_ids = set()
+
+    def load(self):
+        self.allocations = {}
+        self.synced_ids = set()
+        if os.path.exists(self.allocations_file):
+            with open(self.allocations_file, mode="r", newline="") as f:
+                for row in csv.reader(f):
+                    if row:
+                        self.allocations.setdefault(row[0], {})[row[1]] = int(row[2])
+        if os.path.exists(self.synced_file):
+            with open(self.synced_file, mode="r", newline="") as f:
+                for row in csv.reader(f):
+                    if row:
+                        self.synced_ids.add(row[1])
+        if os.path.exists(self.sales_file):
+            with open(self.sales_file, mode="r", newline="") as f:
+                for row in csv.reader(f):
+                    if len(row) > 5:
+                        self.synced_ids.add(row[5])
+
+    def save_allocations(self):
+        # Write a new file and swap it in, so a crash never leaves the
+        # ledger empty and its stock allocated again
+        tmp_file = self.allocations_file + ".tmp"
+        with open(tmp_file, mode="w", newline="") as f:
+            writer = csv.writer(f)
+            for terminal_id, ledger in self.allocations.items():
+                for name, quantity in ledger.items():
+                    if quantity:
+                        writer.writerow([terminal_id, name, quantity])
+        os.replace(tmp_file, self.allocations_file)
+
+    def allocate(self, store, terminal_id, target):
+        """Top up the terminal's allocation of every medication to `target` units from free stock.
+
+        The request names the allocation the terminal wants, not an
+        increment, so repeating it after a lost response grants nothing more.
+        Returns (allocation, granted, catalog): the terminal's allocation of
+        each medication afterwards, the units moved now, and the current
+        price, pricing rules, expiry and prescription flag of every medication.
+        """
+        target = int(target)
+        if target < 0:
+            raise ValueError("allocation target must not be negative")
+        granted = {}
+        with store.lock:
+            ledger = self.allocations.setdefault(terminal_id, {})
+            for name in list(ledger):
+                if name not in store.inventory:
+                    del ledger[name]
+            for name, item in store.inventory.items():
+                grant = max(0, min(target - ledger.get(name, 0), item["quantity"]))
+                if grant:
+                    store.audit.append(audit_log.ALLOCATE, name, f"terminal:{terminal_id}", item, dict(item, quantity=item["quantity"] - grant))
+                    item["quantity"] -= grant
+                    ledger[name] = ledger.get(name, 0) + grant
+                    granted[name] = grant
+                    store.touch(name)
+            store.save_items(*granted)
+            self.save_allocations()
+            allocation = {name: ledger.get(name, 0) for name in store.inventory}
+            catalog = {
+                name: {"price": item["price"], "expiry": item["expiry"], "prescription_required": item["prescription_required"],
+                       "tax_rate": item["tax_rate"], "discounts": item["discounts"]}
+                for name, item in store.inventory.items()
+            }
+        return allocation, granted, catalog
+
+    def apply_sales(self, store, terminal_id, rows):
+        """Record a batch of terminal sales, each at most once.
+
+        Stock comes out of the terminal's allocation first, then out of the
+        store's free stock. Sales are always recorded, because they already
+        happened at the counter. Any quantity that neither source can cover
+        is reported back as a conflict instead of driving stock negative.
+
+        Each sale is written to sales.csv together with its ID before the
+        stock changes are saved. A crash in between can leave stock not yet
+        deducted, but a retried batch never records a sale twice.
+        """
+        # Validate the whole batch before touching any state
+        rows = [(str(sale_id), str(name), int(qty), pricing.money(total), str(prescription_id), _sale_time(timestamp))
+                for sale_id, name, qty, total, prescription_id, timestamp in rows]
+        if any(row[2] <= 0 for row in rows):
+            raise ValueError("sale quantity must be positive")
+        accepted = duplicates = 0
+        conflicts = []
+        with store.lock:
+            ledger = self.allocations.setdefault(terminal_id, {})
+            new_ids = []
+            new_sales = []
+            changed = set()
+            for sale_id, name, qty, total, prescription_id, timestamp in rows:
+                if sale_id in self.synced_ids:
+                    duplicates += 1
+                    continue
+                from_allocation = min(qty, ledger.get(name, 0))
+                remaining = qty - from_allocation
+                item = store.inventory.get(name)
+                from_stock = min(remaining, item["quantity"]) if item else 0
+                store.audit.append(audit_log.TERMINAL_SALE, name, f"terminal:{terminal_id}",
+                                   item, dict(item, quantity=item["quantity"] - from_stock) if item else None)
+                if from_allocation:
+                    ledger[name] -= from_allocation
+                if from_stock:
+                    item["quantity"] -= from_stock
+                    store.touch(name)
+                    changed.add(name)
+                if remaining - from_stock:
+                    conflicts.append({"sale_id": sale_id, "name": name, "shortfall": remaining - from_stock,
+                                      "reason": "insufficient stock" if item else "unknown medication"})
+                new_sales.append(store.record_sale(name, qty, total, prescription_id, timestamp) + [sale_id])
+                self.synced_ids.add(sale_id)
+                new_ids.append(sale_id)
+                accepted += 1
+            if new_ids:
+                store.append_sales(new_sales)
+                store.save_items(*changed)
+                self.save_allocations()
+        return {"accepted": accepted, "duplicates": duplicates, "conflicts": conflicts}
+
+
+class TerminalSync:
+    """Background client that syncs a terminal's store with the central instance."""
+
+    def __init__(self, store, queue, central_url, terminal_id, allocation_target=20, interval=10, timeout=10):
+        self.store = store
+        self.queue = queue
+        self.central_url = central_url.rstrip("/")
+        self.terminal_id = terminal_id
+        self.allocation_target = allocation_target
+        self.interval = interval
+        self.timeout = timeout
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="terminal-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.sync_once()
+            self._stop.wait(self.interval)
+
+    def sync_once(self):
+        """Push queued sales, then refresh the allocation. Returns True when fully synced."""
+        try:
+            while self.queue.pending_count():
+                self.push_sales()
+            self.refresh_allocation()
+        except (urllib.error.URLError, OSError, ValueError) as exc:
+            # Offline or central unavailable: keep selling from the local
+            # allocation and try again on the next tick.
+            self.last_error = str(exc)
+            log.warning("terminal sync failed: %s", exc)
+            return False
+        self.last_error = None
+        return True
+
+    def push_sales(self):
+        batch = self.queue.pending()
+        if not batch:
+            return None
+        result = self._post(f"/api/terminals/{self.terminal_id}/sales", {"sales": batch})
+        self.queue.mark_synced(len(batch))
+        for conflict in result.get("conflicts", []):
+            log.warning("central reported stock conflict: %s", conflict)
+        return result
+
+    def refresh_allocation(self):
+        # The central instance tops the allocation up to the target, so
+        # retrying after a lost response never allocates the same stock twice.
+        result = self._post(f"/api/terminals/{self.terminal_id}/allocation", {"target": self.allocation_target})
+        self.apply_allocation(result["allocation"], result["catalog"])
+
+    def apply_allocation(self, allocation, catalog):
+        """Adopt the central catalog and set local stock to the terminal's allocation."""
+        store = self.store
+        with store.lock:
+            # Sales not pushed yet were made after the central instance
+            # counted the allocation
+            pending = self.queue.pending_quantities()
+            changed = []
+            actor = f"central:{self.terminal_id}"
+            for name in list(store.inventory):
+                if name not in catalog:
+                    store.audit.append(audit_log.CATALOG_SYNC, name, actor, store.inventory[name], None)
+                    del store.inventory[name]
+                    store.prices.invalidate(name)
+                    store.touch(name)
+                    changed.append(name)
+            for name, fields in catalog.items():
+                item = store.inventory.get(name)
+                new_item = dict(item or {"discounts": ""}, **fields)
+                # Amounts travel as decimal strings
+                new_item["price"] = pricing.parse_price(fields["price"])
+                new_item["tax_rate"] = pricing.parse_percent(fields.get("tax_rate") or 0)
+                new_item["quantity"] = max(0, allocation.get(name, 0) - pending.get(name, 0))
+                if new_item != item:
+                    store.audit.append(audit_log.CATALOG_SYNC, name, actor, item, new_item)
+                    store.inventory[name] = new_item
+                    store.prices.invalidate(name)
+                    store.touch(name)
+                    changed.append(name)
+            store.save_items(*changed)
+
+    def _post(self, path, payload):
+        # Sale totals are Decimals and travel as exact strings
+        body = gzip.compress(json.dumps(payload, default=str).encode("utf-8"))
+        headers = {"Content-Type": "application/json", "Content-Encoding": "gzip", "Accept-Encoding": "gzip"}
+        request = urllib.request.Request(self.central_url + path, data=body, headers=headers, method="POST")
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            data = response.read()
+            if response.headers.get("Content-Encoding") == "gzip":
+                data = gzip.decompress(data)
+        return json.loads(data)
@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pharmacy_pos  # noqa: E402
+from idempotency import IdempotencyCache  # noqa: E402
+
+
+@pytest.fixture
+def pos(tmp_path, monkeypatch):
+    """pharmacy_pos with no stores loaded yet and a fresh data directory and idempotency cache."""
+    monkeypatch.setattr(pharmacy_pos, "data_dir", str(tmp_path))
+    monkeypatch.setattr(pharmacy_pos, "stores", {})
+    monkeypatch.setattr(pharmacy_pos, "stores_loaded", False)
+    monkeypatch.setattr(pharmacy_pos, "idempotency_cache", IdempotencyCache())
+    return pharmacy_pos
+
+
+@pytest.fixture
+def client(pos):
+    return pos.app.test_client()
+
+
+@pytest.fixture
+def stocked(client):
+    """A client whose default store holds 50 units of Aspirin at 1.10."""
+    client.post("/inventory", data={"name": "Aspirin", "price": "1.10", "quantity": "50", "expiry": "2030-01-01"})
+    return client
@@ -0,0 +1,64 @@
+import asyncio
+import gzip
+import io
+import re
+from decimal import Decimal
+
+import pytest
+
+pytest.importorskip("quart")
+pytest.importorskip("hypercorn")
+
+import pharmacy_pos_async  # noqa: E402
+from columnar_export import read_pcol  # noqa: E402
+
+
+def run(scenario):
+    """Run `scenario(client)` against the async app, with startup and shutdown."""
+    async def main():
+        async with pharmacy_pos_async.app.test_app() as test_app:
+            return await scenario(test_app.test_client())
+    return asyncio.run(main())
+
+
+def test_forms_pages_and_idempotent_replay(pos):
+    async def scenario(client):
+        form = {"name": "Aspirin", "price": "1.10", "quantity": "50", "expiry": "2030-01-01"}
+        assert (await client.post("/inventory", form=form)).status_code == 200
+        sale = {"name": "Aspirin", "quantity": "3", "idempotency_key": "k1"}
+        first = await client.post("/sell", form=sale)
+        assert b"Sold 3 x Aspirin for $3.30" in await first.get_data()
+        retry = await client.post("/sell", form=sale)
+        assert retry.headers["Idempotent-Replayed"] == "true"
+        for url in ("/", "/sales", "/reports"):
+            assert (await client.get(url)).status_code == 200
+    run(scenario)
+    assert pos.stores["main"].inventory["Aspirin"]["quantity"] == 47
+
+
+def test_json_api_etags_and_compression(pos):
+    async def scenario(client):
+        await client.post("/inventory", form={"name": "Aspirin", "price": "1.10", "quantity": "50", "expiry": "2030-01-01"})
+        response = await client.get("/api/inventory")
+        assert (await response.get_json())["items"]["Aspirin"]["price"] == "1.10"
+        assert (await client.get("/api/inventory", headers={"If-None-Match": response.headers["ETag"]})).status_code == 304
+        patched = await client.patch("/api/inventory/Aspirin", json={"tax_rate": "8.25"})
+        assert (await patched.get_json())["item"]["tax_rate"] == "8.25"
+        page = await client.get("/", headers={"Accept-Encoding": "gzip"})
+        assert page.headers["Content-Encoding"] == "gzip"
+        html = gzip.decompress(await page.get_data()).decode()
+        asset = await client.get(re.search(r'href="(/assets/[^"]+)"', html).group(1))
+        assert asset.headers["Cache-Control"].endswith("immutable")
+    run(scenario)
+
+
+def test_cart_checkout_and_streamed_exports(pos):
+    async def scenario(client):
+        await client.post("/inventory", form={"name": "Aspirin", "price": "1.10", "quantity": "50", "expiry": "2030-01-01"})
+        checkout = await client.post("/api/cart/checkout", json={"items": [{"name": "Aspirin", "quantity": 2}]})
+        assert (await checkout.get_json())["total"] == "2.20"
+        export = await client.get("/export/sales/columnar?format=pcol")
+        assert export.headers["X-Export-Watermark"] == "1"
+        assert read_pcol(io.BytesIO(await export.get_data()))["total"] == [Decimal("2.20")]
+        assert (await client.get("/export/sales")).status_code == 200
+    run(scenario)
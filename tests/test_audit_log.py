@@ -0,0 +1,96 @@
+import math
+import os
+from decimal import Decimal
+
+import pytest
+
+import audit_log
+from audit_log import LEGACY_RECORD, RECORD, AuditLog
+from pharmacy_pos import Store
+
+ITEM = {"price": Decimal("1.10"), "quantity": 50, "expiry": "2030-01-01", "tax_rate": Decimal(0), "discounts": ""}
+
+
+def test_entries_survive_a_restart(tmp_path):
+    log = AuditLog(str(tmp_path))
+    log.append(audit_log.ADD, "Aspirin", "till-1", None, ITEM)
+    log.append(audit_log.SALE, "Aspirin", "till-1", ITEM, dict(ITEM, quantity=47))
+    log.flush()
+    reloaded = AuditLog(str(tmp_path))
+    reloaded.load()
+    entries = reloaded.query("Aspirin")
+    assert [(e["kind"], e["new_quantity"]) for e in entries] == [("sale", 47), ("add", 50)]
+    assert entries[0]["actor"] == "till-1"
+
+
+def test_partial_record_is_cut_off_so_later_records_stay_aligned(tmp_path):
+    log = AuditLog(str(tmp_path))
+    log.append(audit_log.ADD, "Aspirin", None, None, ITEM)
+    log.flush()
+    with open(log._segment_path(0), "ab") as f:
+        f.write(b"\0" * (RECORD.size // 2))
+    reloaded = AuditLog(str(tmp_path))
+    reloaded.load()
+    assert os.path.getsize(reloaded._segment_path(0)) == RECORD.size
+    reloaded.append(audit_log.DELETE, "Aspirin", None, ITEM, None)
+    reloaded.flush()
+    again = AuditLog(str(tmp_path))
+    again.load()
+    assert [e["kind"] for e in again.query("Aspirin")] == ["delete", "add"]
+
+
+def test_timestamps_never_go_backwards(tmp_path, monkeypatch):
+    log = AuditLog(str(tmp_path))
+    clock = iter([2000.0, 1000.0])
+    monkeypatch.setattr(audit_log.time, "time", lambda: next(clock))
+    log.append(audit_log.ADD, "Aspirin", None, None, ITEM)
+    log.append(audit_log.DELETE, "Aspirin", None, ITEM, None)
+    assert list(log.timestamps) == [2_000_000_000, 2_000_000_000]
+
+
+def test_failed_audit_record_leaves_the_inventory_unchanged(tmp_path):
+    store = Store("main", str(tmp_path))
+    store.add_medication("Aspirin", Decimal("1.10"), 50, "2030-01-01", False)
+    with pytest.raises(ValueError):
+        store.update_medication("Aspirin", price=math.nan)
+    assert store.inventory["Aspirin"]["price"] == Decimal("1.10")
+    store.load_inventory()
+    assert store.inventory["Aspirin"]["price"] == Decimal("1.10")
+
+
+def test_value_that_does_not_fit_a_record_is_a_value_error(tmp_path):
+    log = AuditLog(str(tmp_path))
+    with pytest.raises(ValueError):
+        log.append(audit_log.ADD, "Aspirin", None, None, dict(ITEM, quantity=3_000_000_000))
+    assert log.count == 0
+
+
+def test_out_of_range_quantities_are_rejected_before_any_change(stocked, pos):
+    form = {"name": "Ibuprofen", "price": "2.00", "quantity": "3000000000", "expiry": "2030-01-01"}
+    assert stocked.post("/inventory", data=form).status_code == 400
+    assert stocked.patch("/api/inventory/Aspirin", json={"quantity": 3_000_000_000}).status_code == 400
+    cart = {"items": [{"name": "Aspirin", "quantity": 1}, {"name": "Aspirin", "quantity": 3_000_000_000}]}
+    assert stocked.post("/api/cart/checkout", json=cart).status_code == 400
+    assert pos.stores["main"].inventory["Aspirin"]["quantity"] == 50
+    assert "Ibuprofen" not in pos.stores["main"].inventory
+
+
+def test_pricing_rule_changes_are_recorded(stocked, pos):
+    stocked.patch("/api/inventory/Aspirin", json={"tax_rate": "20", "discounts": "1:50"})
+    entry = pos.stores["main"].audit.query("Aspirin")[0]
+    assert entry["kind"] == "update"
+    assert (entry["old_tax_rate"], entry["new_tax_rate"]) == ("0", "20")
+    assert (entry["old_discounts"], entry["new_discounts"]) == (None, "1:50")
+    assert entry["old_price"] == entry["new_price"] == "1.10"
+
+
+def test_segments_in_the_legacy_layout_are_converted(tmp_path):
+    (tmp_path / "strings.csv").write_text("Aspirin\n2030-01-01\n")
+    legacy = LEGACY_RECORD.pack(1_000_000, 1, 0, audit_log.ADD, audit_log.NO_QUANTITY, 50, audit_log.NO_PRICE, 110, 0, 2)
+    (tmp_path / "seg-000000.bin").write_bytes(legacy + legacy[:10])
+    log = AuditLog(str(tmp_path))
+    log.load()
+    assert not (tmp_path / "seg-000000.bin").exists()
+    assert os.path.getsize(log._segment_path(0)) == RECORD.size
+    [entry] = log.query("Aspirin")
+    assert (entry["new_quantity"], entry["new_price"], entry["new_expiry"], entry["new_tax_rate"]) == (50, "1.10", "2030-01-01", None)
@@ -0,0 +1,69 @@
+import io
+from decimal import Decimal
+
+import pytest
+
+import columnar_export
+from columnar_export import INVENTORY_COLUMNS, SALES_COLUMNS, read_pcol
+
+
+def export(columns, batches):
+    return io.BytesIO(b"".join(columnar_export.stream(columns, batches, "pcol")))
+
+
+def test_sales_round_trip_with_exact_totals():
+    sales = [["Aspirin", 3, Decimal("3.30"), "RX1", "2026-01-01 10:00:00"],
+             ["Ibuprofen", 1, Decimal("0.10"), "RX2", "2026-01-02 00:00:01"]]
+    result = read_pcol(export(SALES_COLUMNS, columnar_export.sales_batches(sales, 5, batch_rows=1)))
+    assert result["seq"] == [5, 6]
+    assert result["medication"] == ["Aspirin", "Ibuprofen"]
+    assert result["quantity"] == [3, 1]
+    assert result["total"] == [Decimal("3.30"), Decimal("0.10")]
+    assert result["sold_at"] == [1767261600 * 1_000_000, 1767312001 * 1_000_000]
+
+
+def test_inventory_carries_pricing_rules():
+    items = [("Aspirin", {"price": Decimal("1.10"), "quantity": 50, "expiry": "2030-01-01", "prescription_required": False,
+                          "tax_rate": Decimal("8.25"), "discounts": "10:5"}),
+             ("Rx", {"price": Decimal("0"), "quantity": 0, "expiry": "", "prescription_required": True,
+                     "tax_rate": Decimal("0"), "discounts": ""})]
+    result = read_pcol(export(INVENTORY_COLUMNS, columnar_export.inventory_batches(items)))
+    assert result["price"] == [Decimal("1.10"), Decimal("0.00")]
+    assert result["tax_rate"] == [Decimal("8.25"), 0]
+    assert result["discounts"] == ["10:5", ""]
+    assert result["expiry"] == [21915, None]
+    assert result["prescription_required"] == [False, True]
+
+
+def test_empty_export_has_only_the_header():
+    assert read_pcol(export(SALES_COLUMNS, [])) == {name: [] for name, _ in SALES_COLUMNS}
+
+
+def test_other_streams_are_rejected():
+    with pytest.raises(ValueError):
+        read_pcol(io.BytesIO(b"ARROW1"))
+
+
+def test_columnar_route_streams_the_sales_log(stocked):
+    stocked.post("/sell", data={"name": "Aspirin", "quantity": "2"})
+    response = stocked.get("/export/sales/columnar?format=pcol")
+    assert response.headers["X-Export-Watermark"] == "1"
+    assert read_pcol(io.BytesIO(response.data))["total"] == [Decimal("2.20")]
+    assert stocked.get("/export/sales/columnar?format=pcol&since=1").headers["X-Export-Watermark"] == "1"
+
+
+def test_arrow_export_reads_back_with_exact_decimals():
+    pa = pytest.importorskip("pyarrow")
+    sales = [["Aspirin", 3, Decimal("3.30"), "RX1", "2026-01-01 10:00:00"]]
+    data = b"".join(columnar_export.stream(SALES_COLUMNS, columnar_export.sales_batches(sales, 0), "arrow"))
+    table = pa.ipc.open_stream(data).read_all()
+    assert table.schema.field("total").type == pa.decimal128(12, 2)
+    assert table.column("total").to_pylist() == [Decimal("3.30")]
+    assert table.column("medication").to_pylist() == ["Aspirin"]
+    items = [("Aspirin", {"price": Decimal("1.10"), "quantity": 50, "expiry": "", "prescription_required": False,
+                          "tax_rate": Decimal("8.25"), "discounts": "10:5"})]
+    data = b"".join(columnar_export.stream(INVENTORY_COLUMNS, columnar_export.inventory_batches(items), "arrow"))
+    table = pa.ipc.open_stream(data).read_all()
+    assert table.column("price").to_pylist() == [Decimal("1.10")]
+    assert table.column("tax_rate").to_pylist() == [Decimal("8.2500")]
+    assert table.column("expiry").to_pylist() == [None]
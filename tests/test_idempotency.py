@@ -0,0 +1,64 @@
+import threading
+
+import pytest
+
+from idempotency import IdempotencyCache, IdempotencyConflict, IdempotencyMismatch
+
+
+def test_first_request_claims_the_key_and_a_retry_replays_it():
+    cache = IdempotencyCache()
+    assert cache.begin("k", "body") is None
+    cache.finish("k", "receipt")
+    assert cache.begin("k", "body") == "receipt"
+
+
+def test_reusing_a_key_with_another_body_is_rejected():
+    cache = IdempotencyCache()
+    cache.begin("k", "body")
+    cache.finish("k", "receipt")
+    with pytest.raises(IdempotencyMismatch):
+        cache.begin("k", "other body")
+
+
+def test_discarded_key_runs_again():
+    cache = IdempotencyCache()
+    cache.begin("k", "body")
+    cache.discard("k")
+    assert cache.begin("k", "body") is None
+
+
+def test_duplicate_waits_for_the_request_in_flight():
+    cache = IdempotencyCache()
+    cache.begin("k", "body")
+    result = []
+    waiter = threading.Thread(target=lambda: result.append(cache.begin("k", "body")))
+    waiter.start()
+    cache.finish("k", "receipt")
+    waiter.join(5)
+    assert result == ["receipt"]
+
+
+def test_duplicate_gives_up_when_the_first_request_hangs():
+    cache = IdempotencyCache(wait_timeout=0.05)
+    cache.begin("k", "body")
+    with pytest.raises(IdempotencyConflict):
+        cache.begin("k", "body")
+
+
+def test_expired_keys_are_forgotten(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("idempotency.time.monotonic", lambda: now[0])
+    cache = IdempotencyCache(ttl=60)
+    cache.begin("k", "body")
+    cache.finish("k", "receipt")
+    now[0] += 61
+    assert cache.begin("k", "body") is None
+
+
+def test_least_recently_used_keys_are_evicted():
+    cache = IdempotencyCache(max_entries=2)
+    for key in "abc":
+        cache.begin(key)
+        cache.finish(key, key)
+    assert len(cache) == 2
+    assert cache.begin("a") is None
@@ -0,0 +1,50 @@
+import os
+from decimal import Decimal
+
+import pharmacy_pos
+from pharmacy_pos import Store
+
+
+def reload(store):
+    fresh = Store(store.name, os.path.dirname(store.inventory_file))
+    fresh.load_inventory()
+    return fresh.inventory
+
+
+def test_edits_are_appended_to_the_journal_and_replayed_on_load(tmp_path):
+    store = Store("main", str(tmp_path))
+    store.add_medication("Aspirin", Decimal("1.10"), 50, "2030-01-01", False)
+    store.add_medication("Ibuprofen", Decimal("2.00"), 10, "2030-01-01", True, tax_rate=Decimal("8.25"), discounts="10:5")
+    store.update_medication("Aspirin", quantity=45)
+    store.delete_medication("Ibuprofen")
+    assert not os.path.exists(store.inventory_file)
+    assert store.journal_entries == 4
+    assert reload(store) == store.inventory
+
+
+def test_journal_is_compacted_into_inventory_csv(tmp_path, monkeypatch):
+    monkeypatch.setattr(pharmacy_pos, "JOURNAL_MIN_ENTRIES", 3)
+    store = Store("main", str(tmp_path))
+    store.add_medication("Aspirin", Decimal("1.10"), 50, "2030-01-01", False)
+    for quantity in (49, 48, 47):
+        store.update_medication("Aspirin", quantity=quantity)
+    assert store.journal_entries == 0
+    assert not os.path.exists(store.journal_file)
+    assert reload(store)["Aspirin"]["quantity"] == 47
+
+
+def test_line_cut_short_by_a_crash_is_dropped(tmp_path):
+    store = Store("main", str(tmp_path))
+    store.add_medication("Aspirin", Decimal("1.10"), 50, "2030-01-01", False)
+    with open(store.journal_file, "a") as f:
+        f.write("set,Aspirin,1.1,4")
+    assert reload(store)["Aspirin"]["quantity"] == 50
+    # Later appends start on a fresh line and are not lost
+    store.update_medication("Aspirin", quantity=40)
+    assert reload(store)["Aspirin"]["quantity"] == 40
+
+
+def test_export_includes_journalled_edits(stocked):
+    stocked.post("/inventory", data={"action": "update", "name": "Aspirin", "price": "1.10", "quantity": "7", "expiry": "2030-01-01"})
+    response = stocked.get("/export/inventory")
+    assert response.data.decode().splitlines() == ["Aspirin,1.10,7,2030-01-01,False,0,"]
@@ -0,0 +1,68 @@
+from decimal import Decimal
+
+import pytest
+
+import pricing
+from pricing import PriceCache, PriceSchedule
+
+
+def test_line_total_applies_the_tier_discount_then_tax():
+    quote = PriceSchedule("1.10", "8.25", "10:5,50:12.5").quote(10)
+    assert (quote.subtotal, quote.discount, quote.tax, quote.total) == (1100, 55, 86, 1131)
+
+
+def test_highest_tier_reached_applies():
+    schedule = PriceSchedule("1.00", 0, "10:5,50:12.5")
+    assert [schedule.quote(qty).discount for qty in (9, 10, 49, 50)] == [0, 50, 245, 625]
+
+
+def test_amounts_round_half_up_to_the_cent():
+    assert pricing.money("0.125") == Decimal("0.13")
+    assert PriceSchedule("0.10", "5").quote(1).tax == 1  # 0.5 cents
+
+
+@pytest.mark.parametrize("value", ["nan", "inf", "-inf", float("nan"), "-0.01", "abc", ""])
+def test_invalid_prices_are_rejected(value):
+    with pytest.raises(ValueError):
+        pricing.parse_price(value)
+
+
+def test_price_is_an_exact_decimal():
+    assert pricing.parse_price(2.5) == Decimal("2.50")
+    assert str(pricing.parse_price("4.5")) == "4.50"
+
+
+@pytest.mark.parametrize("value", ["-1", "100.01", "8.00001", "nan", "x"])
+def test_invalid_percentages_are_rejected(value):
+    with pytest.raises(ValueError):
+        pricing.parse_percent(value)
+
+
+def test_percentage_is_an_exact_decimal():
+    assert pricing.parse_percent("8.25") == Decimal("8.25")
+    assert pricing.parse_percent(0) == 0
+
+
+def test_discount_tiers_are_normalized():
+    assert pricing.normalize_discounts(" 50:12.50, 3:10 ") == "3:10,50:12.5"
+    with pytest.raises(ValueError):
+        pricing.normalize_discounts("10")
+
+
+def test_price_cache_is_invalidated_per_medication():
+    cache = PriceCache()
+    item = {"price": Decimal("1.00")}
+    assert cache.quote("Aspirin", item, 2).total == 200
+    item["price"] = Decimal("2.00")
+    assert cache.quote("Aspirin", item, 2).total == 200
+    cache.invalidate("Aspirin")
+    assert cache.quote("Aspirin", item, 2).total == 400
+
+
+def test_non_finite_price_is_rejected_by_the_api(stocked, pos):
+    for price in ("nan", "inf", "-1"):
+        assert stocked.patch("/api/inventory/Aspirin", json={"price": price}).status_code == 400
+        form = {"action": "update", "name": "Aspirin", "price": price, "quantity": "50", "expiry": "2030-01-01"}
+        assert stocked.post("/inventory", data=form).status_code == 400
+    assert pos.stores["main"].inventory["Aspirin"]["price"] == Decimal("1.10")
+    assert b"Sold 1" in stocked.post("/sell", data={"name": "Aspirin", "quantity": "1"}).data
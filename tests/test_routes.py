@@ -0,0 +1,180 @@
+import gzip
+import re
+
+
+def test_sell_replays_a_retried_key(stocked, pos):
+    form = {"name": "Aspirin", "quantity": "3", "idempotency_key": "k1"}
+    first = stocked.post("/sell", data=form)
+    retry = stocked.post("/sell", data=form)
+    assert b"Sold 3" in first.data
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert pos.stores["main"].inventory["Aspirin"]["quantity"] == 47
+
+
+def test_remembered_sell_page_holds_no_inventory_copy(stocked, pos):
+    form = {"name": "Aspirin", "quantity": "3", "idempotency_key": "k1"}
+    stocked.post("/sell", data=form)
+    assert "inventory" not in pos.idempotency_cache._entries[("/sell", "k1")].value.context
+    # A replay renders the current stock, not the stock at the first request
+    stocked.post("/inventory", data={"name": "Ibuprofen", "price": "2.00", "quantity": "5", "expiry": "2030-01-01"})
+    retry = stocked.post("/sell", data=form)
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert b"Ibuprofen" in retry.data and b"Sold 3" in retry.data
+
+
+def test_reused_key_with_another_body_is_rejected(stocked, pos):
+    stocked.post("/sell", data={"name": "Aspirin", "quantity": "3", "idempotency_key": "k1"})
+    response = stocked.post("/sell", data={"name": "Aspirin", "quantity": "5", "idempotency_key": "k1"})
+    assert response.status_code == 422
+    assert pos.stores["main"].inventory["Aspirin"]["quantity"] == 47
+
+
+def test_rejected_request_is_not_replayed(stocked):
+    headers = {"Idempotency-Key": "p1"}
+    assert stocked.patch("/api/inventory/Aspirin", json={"price": "x"}, headers=headers).status_code == 400
+    response = stocked.patch("/api/inventory/Aspirin", json={"price": "2.00"}, headers={"Idempotency-Key": "p2"})
+    assert response.status_code == 200
+    # A corrected retry with the original key runs instead of replaying the 400
+    response = stocked.patch("/api/inventory/Aspirin", json={"price": "2.50"}, headers=headers)
+    assert response.status_code == 200
+    assert "Idempotent-Replayed" not in response.headers
+    assert response.get_json()["item"]["price"] == "2.50"
+
+
+def test_stores_are_loaded_on_the_first_request(client, tmp_path):
+    # As under `flask run` or gunicorn, which never call load_stores()
+    (tmp_path / "stores" / "north").mkdir(parents=True)
+    assert client.get("/north/inventory").status_code == 200
+    assert client.get("/").status_code == 200
+
+
+def test_exports_of_a_new_branch_are_empty(client):
+    client.post("/stores", data={"name": "north"})
+    for path in ("/north/export/sales", "/north/export/inventory"):
+        response = client.get(path)
+        assert response.status_code == 200
+        assert response.mimetype == "text/csv"
+        assert response.data == b""
+
+
+def test_default_store_name_cannot_be_created_again(client):
+    response = client.post("/stores", data={"name": "main"})
+    assert response.status_code == 200
+    assert b"invalid branch name" in response.data
+
+
+def test_templates_are_compiled_at_import(pos):
+    # As under `flask run` or gunicorn, which never run __main__
+    assert not pos.app.jinja_env.auto_reload
+    assert len(pos.app.jinja_env.cache) >= len(pos.templates)
+
+
+def test_inventory_form_rejects_a_malformed_expiry(stocked, pos):
+    form = {"name": "Ibuprofen", "price": "2.00", "quantity": "5", "expiry": "soon"}
+    assert stocked.post("/inventory", data=form).status_code == 400
+    form = {"action": "update", "name": "Aspirin", "price": "1.10", "quantity": "50", "expiry": "31/12/2030"}
+    assert stocked.post("/inventory", data=form).status_code == 400
+    assert pos.stores["main"].inventory["Aspirin"]["expiry"] == "2030-01-01"
+    assert stocked.get("/").status_code == 200
+    assert stocked.get("/reports").status_code == 200
+
+
+def asset_path(page, name):
+    return re.search(rf'(/assets/[0-9a-f]+/{re.escape(name)})"', page.decode()).group(1)
+
+
+def test_assets_are_fingerprinted_and_cached_for_a_year(client, pos):
+    path = asset_path(client.get("/").data, "css/pos.css")
+    assert path == f"/assets/{pos.assets.get('css/pos.css').digest}/css/pos.css"
+    response = client.get(path)
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == f"public, max-age={pos.ASSET_MAX_AGE}, immutable"
+    assert response.headers["ETag"] and not response.headers["ETag"].startswith("W/")
+    assert client.get(path, headers={"If-None-Match": response.headers["ETag"]}).status_code == 304
+
+
+def test_stale_asset_fingerprint_must_be_revalidated(client):
+    response = client.get("/assets/0000000000000000/css/pos.css")
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == "no-cache"
+    assert client.get("/assets/0000000000000000/css/missing.css").status_code == 404
+
+
+def test_responses_are_gzipped_only_when_accepted(client):
+    path = asset_path(client.get("/").data, "css/pos.css")
+    for url in (path, "/"):
+        plain = client.get(url)
+        assert "Content-Encoding" not in plain.headers
+        assert "Accept-Encoding" in plain.headers["Vary"]
+        compressed = client.get(url, headers={"Accept-Encoding": "gzip"})
+        assert compressed.headers["Content-Encoding"] == "gzip"
+        assert gzip.decompress(compressed.data) == plain.data
+
+
+def test_inventory_pages_answer_304_until_the_inventory_changes(stocked):
+    for url in ("/inventory", "/api/inventory"):
+        etag = stocked.get(url).headers["ETag"]
+        assert stocked.get(url, headers={"If-None-Match": etag}).status_code == 304
+    etag = stocked.get("/api/inventory").headers["ETag"]
+    stocked.patch("/api/inventory/Aspirin", json={"quantity": 40})
+    response = stocked.get("/api/inventory", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.get_json()["items"]["Aspirin"]["quantity"] == 40
+
+
+def test_item_etag_changes_only_with_that_item(stocked):
+    etag = stocked.get("/api/inventory/Aspirin").headers["ETag"]
+    stocked.post("/inventory", data={"name": "Ibuprofen", "price": "2.00", "quantity": "5", "expiry": "2030-01-01"})
+    assert stocked.get("/api/inventory/Aspirin", headers={"If-None-Match": etag}).status_code == 304
+    stocked.post("/sell", data={"name": "Aspirin", "quantity": "1"})
+    assert stocked.get("/api/inventory/Aspirin", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_card_fragment_and_patch_return_the_rendered_card(stocked):
+    response = stocked.get("/inventory/card/Aspirin")
+    assert response.status_code == 200
+    assert response.data.lstrip().startswith(b'<div class="card" data-name="Aspirin"')
+    assert stocked.get("/inventory/card/Aspirin", headers={"If-None-Match": response.headers["ETag"]}).status_code == 304
+    assert stocked.get("/inventory/card/Nope").status_code == 404
+    result = stocked.patch("/api/inventory/Aspirin", json={"price": "2.50"}).get_json()
+    assert result["item"]["price"] == "2.50"
+    assert "Price: $2.50" in result["html"]
+    assert stocked.delete("/api/inventory/Aspirin").get_json() == {"name": "Aspirin", "deleted": True}
+    assert stocked.get("/api/inventory/Aspirin").status_code == 404
+
+
+def test_cart_quote_prices_without_selling(stocked, pos):
+    stocked.patch("/api/inventory/Aspirin", json={"tax_rate": "10", "discounts": "10:5"})
+    quote = stocked.post("/api/cart/quote", json={"items": [{"name": "Aspirin", "quantity": 10}]}).get_json()
+    assert (quote["subtotal"], quote["discount"], quote["tax"], quote["total"]) == ("11.00", "0.55", "1.05", "11.50")
+    assert pos.stores["main"].inventory["Aspirin"]["quantity"] == 50
+    assert stocked.post("/api/cart/quote", json={"items": [{"name": "Nope"}]}).status_code == 404
+    assert stocked.post("/api/cart/quote", json={"items": []}).status_code == 400
+
+
+def test_cart_checkout_sells_all_lines_or_none(stocked, pos):
+    stocked.post("/inventory", data={"name": "Morphine", "price": "5.00", "quantity": "5", "expiry": "2030-01-01",
+                                     "prescription_required": "on"})
+    inventory = pos.stores["main"].inventory
+    for items in ([{"name": "Aspirin", "quantity": 2}, {"name": "Morphine", "quantity": 1}],
+                  [{"name": "Aspirin", "quantity": 30}, {"name": "Aspirin", "quantity": 30}]):
+        response = stocked.post("/api/cart/checkout", json={"items": items})
+        assert response.status_code == 409
+        assert "error" in response.get_json()
+    assert (inventory["Aspirin"]["quantity"], inventory["Morphine"]["quantity"]) == (50, 5)
+    assert pos.stores["main"].sales == []
+    cart = {"items": [{"name": "Aspirin", "quantity": 2}, {"name": "Morphine", "quantity": 1, "prescription_id": "RX1"}]}
+    receipt = stocked.post("/api/cart/checkout", json=cart).get_json()
+    assert receipt["total"] == "7.20"
+    assert [line["prescription_id"] for line in receipt["lines"]][1] == "RX1"
+    assert (inventory["Aspirin"]["quantity"], inventory["Morphine"]["quantity"]) == (48, 4)
+
+
+def test_cart_checkout_replays_a_retried_key(stocked, pos):
+    cart = {"items": [{"name": "Aspirin", "quantity": 2}]}
+    first = stocked.post("/api/cart/checkout", json=cart, headers={"Idempotency-Key": "c1"})
+    retry = stocked.post("/api/cart/checkout", json=cart, headers={"Idempotency-Key": "c1"})
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.get_json() == first.get_json()
+    assert pos.stores["main"].inventory["Aspirin"]["quantity"] == 48
+    assert len(pos.stores["main"].sales) == 1
@@ -0,0 +1,185 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.parse
+import urllib.request
+from decimal import Decimal
+
+import pytest
+
+from pharmacy_pos import Store, sell
+from terminal_sync import SaleQueue, TerminalSync
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ClientSync(TerminalSync):
+    """TerminalSync talking to the central app through its test client."""
+
+    def __init__(self, client, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.client = client
+
+    def _post(self, path, payload):
+        response = self.client.post(path, data=json.dumps(payload, default=str))
+        if response.status_code != 200:
+            raise ValueError(response.status_code)
+        return response.get_json()
+
+
+@pytest.fixture
+def terminal(stocked, tmp_path):
+    store = Store("main", str(tmp_path / "terminal"))
+    store.sale_queue = SaleQueue(str(tmp_path / "terminal" / "sale_queue.csv"))
+    os.makedirs(tmp_path / "terminal")
+    return ClientSync(stocked, store, store.sale_queue, "http://central", "T1", allocation_target=10)
+
+
+def central_quantity(pos):
+    return pos.stores["main"].inventory["Aspirin"]["quantity"]
+
+
+def test_allocation_tops_up_to_the_target(terminal, pos):
+    assert terminal.sync_once()
+    assert terminal.store.inventory["Aspirin"]["quantity"] == 10
+    assert terminal.store.inventory["Aspirin"]["price"] == Decimal("1.10")
+    assert central_quantity(pos) == 40
+
+
+def test_repeated_allocation_request_grants_nothing_more(stocked, pos):
+    body = json.dumps({"target": 10})
+    first = stocked.post("/api/terminals/T1/allocation", data=body).get_json()
+    # e.g. the first response was lost and the terminal retries
+    retry = stocked.post("/api/terminals/T1/allocation", data=body).get_json()
+    assert first["allocation"] == retry["allocation"] == {"Aspirin": 10}
+    assert retry["granted"] == {}
+    assert central_quantity(pos) == 40
+
+
+def test_sales_made_offline_are_pushed_and_the_allocation_refilled(terminal, pos):
+    terminal.sync_once()
+    terminal.store.load_sales()
+    assert sell(terminal.store, "Aspirin", 3, "", "test").startswith("Sold 3")
+    assert terminal.queue.pending_quantities() == {"Aspirin": 3}
+    assert terminal.sync_once()
+    assert terminal.queue.pending_count() == 0
+    assert [sale[:2] for sale in pos.stores["main"].sales] == [["Aspirin", 3]]
+    assert terminal.store.inventory["Aspirin"]["quantity"] == 10
+    assert central_quantity(pos) == 37
+
+
+def test_sales_batch_with_a_malformed_timestamp_is_rejected(stocked, pos):
+    batch = {"sales": [["id1", "Aspirin", 1, "1.10", "", "yesterday"]]}
+    response = stocked.post("/api/terminals/T1/sales", data=json.dumps(batch))
+    assert response.status_code == 400
+    assert pos.stores["main"].sales == []
+
+
+def test_sync_body_that_is_not_an_object_is_rejected(stocked):
+    for path in ("/api/terminals/T1/sales", "/api/terminals/T1/allocation"):
+        assert stocked.post(path, data="[1, 2]").status_code == 400
+
+
+def test_synced_sale_ids_are_read_back_from_the_sales_file(stocked, pos):
+    batch = json.dumps({"sales": [["id1", "Aspirin", 2, "2.20", "", "2026-01-01 10:00:00"]]})
+    assert stocked.post("/api/terminals/T1/sales", data=batch).get_json()["accepted"] == 1
+    store = pos.stores["main"]
+    # As after a restart: the sale row alone marks the sale as synced
+    store.terminals.load()
+    assert stocked.post("/api/terminals/T1/sales", data=batch).get_json()["duplicates"] == 1
+    assert len(store.sales) == 1
+    assert central_quantity(pos) == 48
+
+
+def test_sale_cut_short_by_a_crash_is_dropped(tmp_path):
+    path = str(tmp_path / "sale_queue.csv")
+    queue = SaleQueue(path)
+    queue.append(["Aspirin", 1, Decimal("1.10"), "", "2026-01-01 10:00:00"])
+    size = os.path.getsize(path)
+    for torn in ("abc123,Aspi", "abc123,Aspirin,1\n"):
+        with open(path, "a", newline="") as f:
+            f.write(torn)
+        queue.load()
+        assert [row[1:] for row in queue.rows] == [["Aspirin", 1, Decimal("1.10"), "", "2026-01-01 10:00:00"]]
+        assert os.path.getsize(path) == size
+    queue.append(["Aspirin", 2, Decimal("2.20"), "", "2026-01-01 10:01:00"])
+    queue.load()
+    assert [row[2] for row in queue.rows] == [1, 2]
+
+
+# -------------------------
+# Two processes
+# -------------------------
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start(data_dir, port, *args):
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, "pharmacy_pos.py"), "--port", str(port), "--data-dir", str(data_dir), *args],
+                               cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_for(lambda: get(port, "/api/inventory") is not None, f"server on port {port} did not start")
+    return process
+
+
+def stop(process):
+    process.terminate()
+    process.wait(10)
+
+
+def get(port, path):
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=5) as response:
+            return response.read()
+    except OSError:
+        return None
+
+
+def post_form(port, path, fields):
+    data = urllib.parse.urlencode(fields).encode()
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", data=data, timeout=5) as response:
+        return response.read()
+
+
+def quantity(port):
+    items = json.loads(get(port, "/api/inventory"))["items"]
+    return items["Aspirin"]["quantity"] if "Aspirin" in items else None
+
+
+def wait_for(condition, message, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return
+        time.sleep(0.1)
+    raise AssertionError(message)
+
+
+def test_terminal_keeps_selling_while_the_central_instance_is_down(tmp_path):
+    central_port, terminal_port = free_port(), free_port()
+    central = start(tmp_path / "central", central_port)
+    terminal = None
+    try:
+        post_form(central_port, "/inventory", {"name": "Aspirin", "price": "1.10", "quantity": "50", "expiry": "2030-01-01"})
+        terminal = start(tmp_path / "terminal", terminal_port, "--terminal", "T1", "--central", f"http://127.0.0.1:{central_port}",
+                         "--allocation", "10", "--sync-interval", "0.2")
+        wait_for(lambda: quantity(terminal_port) == 10, "terminal never received its allocation")
+        assert quantity(central_port) == 40
+
+        stop(central)
+        assert b"Sold 3 x Aspirin" in post_form(terminal_port, "/sell", {"name": "Aspirin", "quantity": "3"})
+        assert quantity(terminal_port) == 7
+
+        central = start(tmp_path / "central", central_port)
+        wait_for(lambda: quantity(central_port) == 37, "offline sale never reached the central instance")
+        wait_for(lambda: quantity(terminal_port) == 10, "terminal allocation was not refilled")
+        sales = get(central_port, "/export/sales").decode().splitlines()
+        assert [line.split(",")[:3] for line in sales] == [["Aspirin", "3", "3.30"]]
+    finally:
+        if terminal is not None:
+            stop(terminal)
+        stop(central)